@@ -3,6 +3,25 @@ ASGI config for local_servicehub project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The JSON API views (nearby providers, booking history, booking creation)
+are async and use Django's async ORM, so under ASGI a slow request waits on
+the event loop instead of holding a worker thread. Run it with uvicorn
+workers managed by gunicorn:
+
+    gunicorn local_servicehub.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+or, for development, ``uvicorn local_servicehub.asgi:application --reload``.
+
+Run the background job runner next to the web workers, under the same
+process supervisor:
+
+    python manage.py run_jobs
+
+It makes the provider photo thumbnails (see servicehub_app.jobs). Without
+it, listings keep showing the full-size uploaded photos.
+The WSGI entry point (``local_servicehub.wsgi``) keeps working for the same
+views. ``manage.py bench_asgi`` compares the two handler paths in-process.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
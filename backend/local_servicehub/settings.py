@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -76,6 +77,8 @@ JAZMIN_UI_TWEAKS = {
 }
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware too
+    'servicehub_app.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -109,14 +112,93 @@ WSGI_APPLICATION = 'local_servicehub.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
-
-DATABASES = {
+#
+# DB_ENGINE selects "sqlite" (default) or "postgresql"; the other DB_*
+# variables below fill in the connection details.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'servicehub'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # Persistent connections, reused across requests by each worker
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool shared by a worker's threads. Django
+        # requires CONN_MAX_AGE = 0 when pooling.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+            # A file rather than the default shared in-memory database, whose
+            # connections fail with "table is locked" instead of waiting, so
+            # tests can run concurrent transactions (see BookingConcurrencyTests)
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'servicehub-test.sqlite3')},
+        }
+    }
+    if os.environ.get('DB_SQLITE_TUNING', '1') == '1':
+        DATABASES['default']['OPTIONS'] = {
+            # WAL lets readers run alongside the single writer; NORMAL is
+            # durable in WAL mode except across power loss
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA mmap_size=134217728;'
+            ),
+            # Take the write lock at BEGIN so concurrent transactions wait on
+            # busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        }
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# CACHE_BACKEND selects "locmem" (default, per process), "file" (shared by
+# the workers on one host) or "redis" (shared by every host; also works with
+# Redis-compatible servers such as Valkey, and needs the redis package).
+# Only a shared backend lets one worker's provider cache invalidations reach
+# the others straight away.
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'servicehub'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             os.path.join(tempfile.gettempdir(), 'servicehub-cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', ''),
     }
 }
 
+# Sessions are read from the cache and written through to the database, so
+# most authenticated requests no longer query django_session
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -166,5 +248,42 @@ LOGIN_REDIRECT_URL = 'home'
 # Redirect to home page after logout
 LOGOUT_REDIRECT_URL = 'home'
 
+# Platform commission taken from each booking total, per provider service type.
+# Amounts are split in Decimal; the fee is rounded half-up to the cent.
+PLATFORM_COMMISSION_RATES = {
+    'default': '0.10',
+}
+
+# Seconds a worker may serve its cached provider list before reloading it.
+# Invalidations and row refreshes (ratings, names, photos) reach other workers
+# immediately only with a shared CACHES backend.
+PROVIDER_CACHE_TTL = 60
+
+# Pub/sub used by the booking event stream. The in-process backend only
+# reaches streams open on the same worker; see servicehub_app.events.
+BOOKING_EVENTS_BACKEND = 'servicehub_app.events.InProcessBackend'
+
+# Requests slower than this are logged to "servicehub.slow_requests" with
+# their slowest SQL statements
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_TOP_SQL = int(os.environ.get('SLOW_REQUEST_TOP_SQL', 5))
+# Bearer token a Prometheus scraper sends to /metrics; staff users can always read it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Token-bucket limits on the write APIs, per signed-in user and per client
+# IP: "N/s", "N/m", "N/h" or "N/d" allows bursts of N, refilling over that
+# period (see servicehub_app.ratelimit). Limits are only shared between
+# workers through a shared cache backend.
+RATE_LIMITS = {
+    'create_booking': {'user': '10/m', 'ip': '30/m'},
+    'send_quote': {'user': '30/m', 'ip': '60/m'},
+    'submit_rating': {'user': '10/m', 'ip': '30/m'},
+    'submit_feedback': {'user': '5/m', 'ip': '10/m'},
+}
+RATE_LIMIT_CACHE = os.environ.get('RATE_LIMIT_CACHE', 'default')
+# META key holding the client address when behind a reverse proxy, e.g.
+# "HTTP_X_FORWARDED_FOR"; only set it if the proxy always writes that header
+RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER', '')
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
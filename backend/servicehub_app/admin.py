@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import UserProfile, Booking,Provider, Client, ClientFeedback, ProviderFeedback
+from django.db import transaction
 from django.utils import timezone
+from .models import UserProfile, Booking, BookingTransition, Provider, Client, ClientFeedback, ProviderFeedback, ProviderLedger
+from .models import Job, PayoutBatch, ProviderPayout, ServiceAvailability
+from .payouts import start_batch, process_batch
+from .provider_cache import provider_cache
+from . import search
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -8,18 +13,33 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ('is_provider', 'is_verified', 'service_type')
     search_fields = ('user__username', 'service_type')
 
+class BookingTransitionInline(admin.TabularInline):
+    model = BookingTransition
+    extra = 0
+    can_delete = False
+    readonly_fields = ('from_status', 'to_status', 'actor', 'created_at')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('provider', 'total_amount', 'provider_cut', 'status', 'is_paid_to_provider')
     list_filter = ('status', 'is_paid_to_provider')
+    # Status only moves through Booking.transition(), which logs each change,
+    # and payment only through mark_as_paid/run_payouts, which also record
+    # the transition and the provider's payout
+    readonly_fields = ('status', 'is_paid_to_provider', 'payout_date')
+    inlines = [BookingTransitionInline]
     actions = ['mark_as_paid']
 
     @admin.action(description='Mark selected bookings as Paid to Provider')
     def mark_as_paid(self, request, queryset):
-        # Ensure we only pay out completed jobs
-        completed_jobs = queryset.filter(status='completed')
-        count = completed_jobs.update(is_paid_to_provider=True, payout_date=timezone.now())
-        self.message_user(request, f"Successfully marked {count} jobs as paid.")
+        # Only completed, unpaid jobs are claimed; payment runs in chunks
+        batch = start_batch(queryset)
+        stats = process_batch(batch)
+        self.message_user(request, f"Successfully marked {stats['paid']} jobs as paid ({batch}).")
 
 @admin.register(Provider)
 class ProviderAdmin(admin.ModelAdmin):
@@ -30,13 +50,28 @@ class ProviderAdmin(admin.ModelAdmin):
     list_display = ('user', 'service_type', 'is_verified', 'phone_number', 'latitude', 'longitude')
     list_filter = ('is_verified', 'service_type')
     search_fields = ('user__username', 'service_type')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index rather than LIKE '%term%' scans
+        if not search_term:
+            return queryset, False
+        ids = [profile_id for profile_id, _ in search.search(search_term, verified_only=False)]
+        return queryset.filter(pk__in=ids), False
     
     # Action for manual verification per your project methodology
     actions = ['make_verified']
 
     @admin.action(description='Verify selected providers')
     def make_verified(self, request, queryset):
-        queryset.update(is_verified=True)
+        with transaction.atomic():
+            newly_verified = list(queryset.filter(is_verified=False).select_for_update())
+            queryset.update(is_verified=True)
+            for profile in newly_verified:
+                profile.is_verified = True
+            # update() skips save(), which keeps the availability counts
+            ServiceAvailability.record_profiles(newly_verified)
+        # update() skips post_save, so drop the cached provider list by hand
+        provider_cache.invalidate()
         self.message_user(request, "Providers verified for 3km radius matching.")
 
 @admin.register(Client)
@@ -66,4 +101,61 @@ class ProviderFeedbackAdmin(admin.ModelAdmin):
     search_fields = ('subject', 'message', 'user__username')
 
     def get_queryset(self, request):
-        return super().get_queryset(request).filter(user_type='provider')
\ No newline at end of file
+        return super().get_queryset(request).filter(user_type='provider')
+
+@admin.register(ProviderLedger)
+class ProviderLedgerAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'total_earned', 'total_paid', 'pending_payout', 'updated_at')
+    search_fields = ('provider__username',)
+    readonly_fields = ('provider', 'total_earned', 'total_paid', 'updated_at')
+
+
+class ProviderPayoutInline(admin.TabularInline):
+    model = ProviderPayout
+    extra = 0
+    can_delete = False
+    readonly_fields = ('provider', 'amount', 'booking_count')
+
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'booking_count', 'total_amount', 'created_at', 'completed_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'cutoff', 'booking_count', 'total_amount', 'created_at', 'completed_at')
+    inlines = [ProviderPayoutInline]
+    actions = ['resume_batches']
+
+    def has_add_permission(self, request):
+        # Batches are started from the Booking list or the run_payouts command
+        return False
+
+    @admin.action(description='Resume selected unfinished batches')
+    def resume_batches(self, request, queryset):
+        paid = 0
+        for batch in queryset.exclude(status='completed'):
+            paid += process_batch(batch)['paid']
+        self.message_user(request, f"Resumed batches paid {paid} more jobs.")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'attempts', 'created_at', 'started_at', 'wait_time', 'duration')
+    list_filter = ('status', 'task')
+    search_fields = ('task',)
+    readonly_fields = ('task', 'kwargs', 'status', 'attempts', 'max_attempts', 'run_after',
+                       'created_at', 'started_at', 'finished_at', 'wait_time', 'duration', 'error')
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        # Jobs are queued by the code that needs them (see Job.enqueue)
+        return False
+
+    @admin.display(description='Waited')
+    def wait_time(self, obj):
+        # Time from queueing to the start of the latest attempt
+        return obj.started_at - obj.created_at if obj.started_at else None
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry_jobs(self, request, queryset):
+        count = queryset.filter(status='failed').update(status='queued', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"Queued {count} jobs to run again.")
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ServicehubAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'servicehub_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Installs the per-request query recorder on new database connections
+        from . import instrumentation  # noqa: F401
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+def cache_key(prefix, *parts):
+    """Key for a cached value that depends on ``parts`` (hashed, so any repr-able values work)."""
+    return f"servicehub:{prefix}:{hashlib.sha1(repr(parts).encode()).hexdigest()}"
+
+
+def get_or_build(key, build, timeout=DEFAULT_TIMEOUT):
+    """Return the cached value for ``key``, calling ``build()`` to fill it on a miss.
+
+    Keys should include a version marker for the data they were built from;
+    nothing here invalidates them.
+    """
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def aget_or_build(key, build, timeout=DEFAULT_TIMEOUT):
+    """Async get_or_build() for async views; ``build`` is a coroutine function."""
+    value = await cache.aget(key)
+    if value is None:
+        value = await build()
+        await cache.aset(key, value, timeout)
+    return value
@@ -0,0 +1,95 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+DEFAULT_PLATFORM_RATE = Decimal('0.10')
+
+
+def to_money(value):
+    """Convert an amount (Decimal, str, int or float) to Decimal cents."""
+    if value is None or value == '':
+        return ZERO
+    if not isinstance(value, Decimal):
+        # str() first so floats keep their printed value, not their binary one
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def platform_rate(service_type=None):
+    """Platform commission rate for a service type, from PLATFORM_COMMISSION_RATES."""
+    rates = getattr(settings, 'PLATFORM_COMMISSION_RATES', {})
+    rate = rates.get(service_type, rates.get('default', DEFAULT_PLATFORM_RATE))
+    return Decimal(str(rate))
+
+
+def has_service_rates():
+    """True when any service type overrides the default rate."""
+    return any(key != 'default' for key in getattr(settings, 'PLATFORM_COMMISSION_RATES', {}))
+
+
+def split_amount(total_amount, service_type=None):
+    """Split a booking total into (provider_cut, platform_fee).
+
+    The fee is rounded half-up to the cent and the provider gets the rest, so
+    the two parts always add back up to the quantized total exactly.
+    """
+    total = to_money(total_amount)
+    fee = (total * platform_rate(service_type)).quantize(CENT, rounding=ROUND_HALF_UP)
+    return total - fee, fee
+
+
+def recompute_commissions(bookings, batch_size=1000, include_paid=False):
+    """Re-split every booking in the queryset with the current rates.
+
+    Bookings already paid out are left alone unless include_paid is set,
+    since their ProviderPayout amounts can't follow. Each batch of
+    batch_size bookings is written with bulk_update in its own transaction,
+    together with the change to its providers' ledgers, so the database
+    write lock is never held for the whole run. Returns (checked, changed).
+    """
+    checked = changed = 0
+    bookings = bookings.exclude(total_amount=None)
+    if not include_paid:
+        bookings = bookings.filter(is_paid_to_provider=False)
+    bookings = bookings.select_related('provider__userprofile').order_by('pk')
+    last_pk = 0
+    while True:
+        # Keyset pages rather than one open cursor, so every batch commits
+        batch = list(bookings.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return checked, changed
+        last_pk = batch[-1].pk
+        checked += len(batch)
+        changed += _reprice_batch(batch)
+
+
+def _reprice_batch(batch):
+    from .models import Booking, ProviderLedger
+
+    pending, ledger_deltas = [], {}
+    for booking in batch:
+        profile = getattr(booking.provider, 'userprofile', None)
+        cut, fee = split_amount(booking.total_amount, profile.service_type if profile else None)
+        if (booking.provider_cut, booking.platform_fee) == (cut, fee):
+            continue
+
+        provider_id, old_earned, old_paid = booking.ledger_contribution()
+        booking.provider_cut, booking.platform_fee = cut, fee
+        booking.updated_at = timezone.now()
+        _, new_earned, new_paid = booking.ledger_contribution()
+        earned, paid = ledger_deltas.get(provider_id, (ZERO, ZERO))
+        ledger_deltas[provider_id] = (earned + new_earned - old_earned, paid + new_paid - old_paid)
+        pending.append(booking)
+    if not pending:
+        return 0
+
+    with transaction.atomic():
+        Booking.objects.bulk_update(pending, ['provider_cut', 'platform_fee', 'updated_at'])
+        # bulk_update bypasses Booking.save(), so move the ledgers here
+        for provider_id, (earned, paid) in ledger_deltas.items():
+            ProviderLedger.record(provider_id, earned, paid)
+    return len(pending)
@@ -0,0 +1,27 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Build an ETag from cheap version markers rather than the response body."""
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None, **cache_control):
+    """Return a 304 response if the client's copy is still current, else None."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified, **cache_control)
+    return response
+
+
+def set_validators(response, etag, last_modified=None, **cache_control):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, **cache_control)
+    return response
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'servicehub_app.events.InProcessBackend'
+
+
+class EventBackend:
+    """Interface for delivering booking events to a user's open streams.
+
+    publish() may be called from any thread. subscribe() is called on the
+    event loop serving the stream and returns a subscription exposing
+    ``async get()`` and ``close()``.
+    """
+
+    def publish(self, user_id, event):
+        raise NotImplementedError
+
+    def subscribe(self, user_id):
+        raise NotImplementedError
+
+
+class InProcessSubscription:
+    def __init__(self, backend, user_id, max_queued):
+        self.backend = backend
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queued)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop; a client that stops reading just
+        # misses events rather than growing the queue without bound
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class InProcessBackend(EventBackend):
+    """Delivers events to streams held open by this worker process only.
+
+    With several workers a user's stream may live in another process, so
+    multi-worker deployments need a shared backend (e.g. Redis pub/sub)
+    implementing the same interface.
+    """
+
+    def __init__(self, max_queued=100):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.max_queued = max_queued
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+    def subscribe(self, user_id):
+        subscription = InProcessSubscription(self, user_id, self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(getattr(settings, 'BOOKING_EVENTS_BACKEND', DEFAULT_BACKEND))()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'BOOKING_EVENTS_BACKEND':
+        get_backend.cache_clear()
+
+
+def booking_event(booking, event_type):
+    return {
+        'type': event_type,
+        'booking_id': booking.pk,
+        'status': booking.get_status_display(),
+        'total_amount': str(booking.total_amount) if booking.total_amount is not None else None,
+    }
+
+
+def notify_booking(booking, event_type):
+    """Send a booking event to its client and provider straight away."""
+    _send((booking.client_id, booking.provider_id), booking_event(booking, event_type))
+
+
+def publish_booking_event(booking, event_type):
+    """Like notify_booking(), but only once the current transaction commits."""
+    event = booking_event(booking, event_type)
+    transaction.on_commit(partial(_send, (booking.client_id, booking.provider_id), event))
+
+
+def _send(user_ids, event):
+    backend = get_backend()
+    for user_id in user_ids:
+        backend.publish(user_id, event)
@@ -0,0 +1,111 @@
+from math import radians, cos, sin, asin, sqrt, floor, isfinite
+
+import numpy as np
+
+# Grid cells are GRID_SIZE degrees square (~5.5km at the equator), so a 3km
+# search only ever touches a handful of neighbouring cells.
+GRID_SIZE = 0.05
+# Service availability is counted per finer TILE_SIZE tile (~1.1km)
+TILE_SIZE = 0.01
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+
+# Haversine formula to calculate distance in km
+def calculate_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    c = 2 * asin(sqrt(a))
+    return c * EARTH_RADIUS_KM
+
+
+def valid_coordinates(lat, lon):
+    # float() accepts "nan" and "inf", which the grid arithmetic can't handle
+    return isfinite(lat) and isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180
+
+
+def grid_cell(lat, lon):
+    """Return the grid cell key for a coordinate, or None if it is incomplete."""
+    if lat is None or lon is None:
+        return None
+    return f"{floor(float(lat) / GRID_SIZE)}:{floor(float(lon) / GRID_SIZE)}"
+
+
+def tile(lat, lon):
+    """Return the (row, column) of the availability tile holding a coordinate, or None."""
+    if lat is None or lon is None:
+        return None
+    return floor(float(lat) / TILE_SIZE), floor(float(lon) / TILE_SIZE)
+
+
+def tiles_in_box(min_lat, max_lat, min_lon, max_lon):
+    """Return inclusive (row, column) ranges of the tiles overlapping a bounding box."""
+    return (floor(min_lat / TILE_SIZE), floor(max_lat / TILE_SIZE)), (floor(min_lon / TILE_SIZE), floor(max_lon / TILE_SIZE))
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing the search circle."""
+    lat, lon = float(lat), float(lon)
+    dlat = radius_km / KM_PER_DEGREE
+    # Longitude degrees shrink towards the poles; clamp to avoid dividing by ~0
+    dlon = radius_km / (KM_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def cells_in_box(min_lat, max_lat, min_lon, max_lon):
+    """List every grid cell key overlapping the given bounding box."""
+    lat_range = range(floor(min_lat / GRID_SIZE), floor(max_lat / GRID_SIZE) + 1)
+    lon_range = range(floor(min_lon / GRID_SIZE), floor(max_lon / GRID_SIZE) + 1)
+    return [f"{i}:{j}" for i in lat_range for j in lon_range]
+
+
+class ProviderMatcher:
+    """Vectorised Haversine matching over a fixed set of provider coordinates.
+
+    Coordinates are converted to radians once, so each search is a single
+    NumPy pass over every candidate instead of one calculate_distance() call
+    per provider.
+    """
+
+    def __init__(self, ids, latitudes, longitudes):
+        self.ids = np.asarray(ids)
+        self.lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+        self.lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, lat, lon, candidates=None):
+        lat, lon = radians(float(lat)), radians(float(lon))
+        plat, plon, pcos = self.lat, self.lon, self.cos_lat
+        if candidates is not None:
+            plat, plon, pcos = plat[candidates], plon[candidates], pcos[candidates]
+        a = np.sin((plat - lat) / 2) ** 2 + cos(lat) * pcos * np.sin((plon - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def nearest(self, lat, lon, radius_km, k=None, candidates=None, after=None):
+        """Return [(id, distance_km), ...] within radius_km, nearest first, at most k.
+
+        ``candidates`` optionally restricts the search to an array of positions.
+        ``after`` is a (distance_km, id) pair; only results ordered after it
+        are returned, which lets callers page through the results.
+        """
+        dist = self.distances(lat, lon, candidates)
+        ids = self.ids if candidates is None else self.ids[candidates]
+        keep = dist <= radius_km
+        if after is not None:
+            after_dist, after_id = after
+            keep &= (dist > after_dist) | ((dist == after_dist) & (ids > after_id))
+        idx = np.flatnonzero(keep)
+        if k is not None and len(idx) > k:
+            if k <= 0:
+                return []
+            # Only the k closest need a full sort; keep everything tied with
+            # the k-th distance so the id tie-break below stays stable
+            kth = np.partition(dist[idx], k - 1)[k - 1]
+            idx = idx[dist[idx] <= kth]
+        idx = idx[np.lexsort((ids[idx], dist[idx]))][:k]
+        return list(zip(ids[idx].tolist(), dist[idx].tolist()))
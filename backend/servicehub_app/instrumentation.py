@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('servicehub.slow_requests')
+
+# Queries of the request being handled. A ContextVar rather than a
+# thread-local, because asgiref copies the context into the threads that run
+# the ORM calls of async views.
+_current = ContextVar('servicehub_request_stats', default=None)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label set."""
+
+    def __init__(self, name, help_text, buckets, labels=('view', 'method')):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['buckets'][i] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, series['buckets']):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return lines
+
+
+class Metrics:
+    """Request metrics for this worker process, rendered for /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.duration = Histogram('servicehub_request_duration_seconds', 'Wall time per request.', SECONDS_BUCKETS)
+        self.db_time = Histogram('servicehub_request_db_seconds', 'Time spent in SQL per request.', SECONDS_BUCKETS)
+        self.queries = Histogram('servicehub_request_queries', 'SQL queries per request.', QUERY_BUCKETS)
+        self.size = Histogram('servicehub_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+        self.responses = Counter()
+
+    def record(self, view, method, status, duration, db_time, queries, size):
+        labels = (view, method)
+        with self._lock:
+            self.duration.observe(labels, duration)
+            self.db_time.observe(labels, db_time)
+            self.queries.observe(labels, queries)
+            if size is not None:
+                self.size.observe(labels, size)
+            self.responses[(view, method, str(status))] += 1
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.db_time, self.queries, self.size):
+                lines += histogram.render()
+            lines += ['# HELP servicehub_responses_total Responses by status code.',
+                      '# TYPE servicehub_responses_total counter']
+            for (view, method, status), count in sorted(self.responses.items()):
+                lines.append(f'servicehub_responses_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+
+metrics = Metrics()
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper timing every query made for the current request."""
+    queries = _current.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((time.perf_counter() - start, sql))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    """Time each request and its SQL, per URL name.
+
+    Adds a Server-Timing header, feeds the /metrics histograms and logs
+    requests slower than SLOW_REQUEST_MS together with their slowest
+    SLOW_REQUEST_TOP_SQL statements.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported have no recorder yet
+        install_query_recorder(None, connection)
+        queries = []
+        token = _current.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, queries)
+
+    async def __acall__(self, request):
+        queries = []
+        token = _current.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, queries)
+
+    def finish(self, request, response, duration, queries):
+        db_time = sum(elapsed for elapsed, _ in queries)
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        size = None if response.streaming else len(response.content)
+        metrics.record(view, request.method, response.status_code, duration, db_time, len(queries), size)
+
+        response['Server-Timing'] = (
+            f'total;dur={duration * 1000:.1f}, db;dur={db_time * 1000:.1f};desc="{len(queries)} queries"'
+        )
+
+        if duration * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 500):
+            top = sorted(queries, key=lambda q: q[0], reverse=True)[:getattr(settings, 'SLOW_REQUEST_TOP_SQL', 5)]
+            repeats = Counter(sql for _, sql in queries).most_common(1)
+            logger.warning(
+                "Slow request %s %s (%s): %.0fms, %d queries in %.0fms%s\n%s",
+                request.method, request.path, view, duration * 1000, len(queries), db_time * 1000,
+                # The same statement many times over usually means an N+1
+                f", one statement run {repeats[0][1]} times" if repeats and repeats[0][1] > 1 else '',
+                '\n'.join(f"  {elapsed * 1000:.1f}ms  {sql}" for elapsed, sql in top),
+            )
+        return response
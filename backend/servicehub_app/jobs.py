@@ -0,0 +1,73 @@
+import traceback
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+# A failed attempt is retried after RETRY_DELAY, doubling each time
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def claim_next():
+    """Mark the next due job as running and return it, or None if none is due.
+
+    The claim is a conditional UPDATE on status, so several runners can poll
+    the same table without running a job twice.
+    """
+    while True:
+        job = Job.objects.filter(status='queued', run_after__lte=timezone.now()).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=timezone.now(), finished_at=None, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    """Call the job's task and record the outcome; failures are retried up to max_attempts."""
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = 'failed'
+    else:
+        job.status = 'done'
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'run_after', 'finished_at'])
+    return job
+
+
+def run_pending(max_jobs=None):
+    """Run due jobs until none are left (or max_jobs have run). Returns the jobs run."""
+    finished = []
+    while max_jobs is None or len(finished) < max_jobs:
+        job = claim_next()
+        if job is None:
+            break
+        finished.append(run_job(job))
+    return finished
+
+
+def requeue_stale(older_than):
+    """Queue again jobs left running for longer than ``older_than``, e.g. by a killed runner.
+
+    Jobs already on their last attempt are failed instead, so a task that
+    keeps killing the runner cannot loop forever. Returns the number requeued.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', started_at__lt=now - older_than)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now, error='The runner stopped during the last attempt.',
+    )
+    return stale.update(status='queued')
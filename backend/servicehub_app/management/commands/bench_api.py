@@ -0,0 +1,170 @@
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from servicehub_app.models import Booking, UserProfile
+
+from .seed_data import PREFIX, TOWNS, scatter
+
+ENDPOINTS = ['nearby_providers', 'my_bookings', 'provider_dashboard', 'create_booking',
+             'send_quote', 'accept_quote', 'complete_job', 'submit_rating']
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every API endpoint through the Django test client against data from seed_data, "
+            "and print latency percentiles, queries per request and throughput as JSON. "
+            "Write endpoints change the data, so run it against a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Threads sending requests.")
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', '-o', help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.load_targets(options['requests'])
+
+        results = {}
+        for name in options['endpoints']:
+            requests = [getattr(self, name)(i) for i in range(options['requests'])]
+            # Measure the endpoints themselves, not how fast they start answering 429
+            with override_settings(RATE_LIMITS={}):
+                results[name] = self.run(requests, options['concurrency'])
+            if options['verbosity'] >= 2:
+                self.stderr.write(f"{name}: {results[name]}")
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'requests_per_endpoint': options['requests'],
+            'concurrency': options['concurrency'],
+            'endpoints': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        self.stdout.write(report)
+
+    def load_targets(self, count):
+        seeded = {'user__username__startswith': PREFIX}
+        self.providers = list(UserProfile.objects.filter(is_provider=True, is_verified=True, **seeded)
+                              .select_related('user')[:200])
+        self.clients = list(User.objects.filter(username__startswith=f'{PREFIX}c')[:200])
+        if not self.providers or not self.clients:
+            raise CommandError("No seed data found; run seed_data first.")
+
+        bookings = Booking.objects.filter(provider__username__startswith=PREFIX)
+        self.pending = list(bookings.filter(status=Booking.Status.PENDING).select_related('provider')[:count])
+        self.quoted = list(bookings.filter(status=Booking.Status.QUOTED).select_related('client')[:count])
+        self.accepted = list(bookings.filter(status=Booking.Status.ACCEPTED).select_related('provider')[:count])
+        self.completed = list(bookings.filter(status__in=Booking.EARNED_STATUSES)
+                              .select_related('client', 'provider')[:count])
+        if not (self.pending and self.quoted and self.accepted and self.completed):
+            raise CommandError("Seed data has no pending, quoted, accepted or completed bookings to work on.")
+
+    # Each scenario returns (user or None, method, path, JSON body or query params)
+
+    def nearby_providers(self, i):
+        lat, lon = scatter(self.rng, self.rng.choices(TOWNS, weights=[t[3] for t in TOWNS])[0])
+        return None, 'GET', '/api/nearby-providers/', {'lat': lat, 'lon': lon}
+
+    def my_bookings(self, i):
+        return self.rng.choice(self.clients), 'GET', '/api/my-bookings/', {}
+
+    def provider_dashboard(self, i):
+        return self.rng.choice(self.providers).user, 'GET', '/dashboard/', {}
+
+    def create_booking(self, i):
+        profile = self.rng.choice(self.providers)
+        return self.rng.choice(self.clients), 'POST', f'/api/book/{profile.pk}/', {'description': 'Bench job'}
+
+    def send_quote(self, i):
+        booking = self.pending[i % len(self.pending)]
+        return booking.provider, 'POST', f'/api/send-quote/{booking.pk}/', {'price': self.rng.randrange(500, 20000, 50)}
+
+    def accept_quote(self, i):
+        # Each quote can only be accepted once; repeats measure the refusal
+        booking = self.quoted[i % len(self.quoted)]
+        return booking.client, 'POST', f'/api/accept-quote/{booking.pk}/', {}
+
+    def complete_job(self, i):
+        # Each accepted booking can only be completed once
+        booking = self.accepted[i % len(self.accepted)]
+        return booking.provider, 'POST', f'/api/complete-job/{booking.pk}/', {}
+
+    def submit_rating(self, i):
+        booking = self.completed[i % len(self.completed)]
+        body = {'provider_username': booking.provider.username, 'stars': self.rng.randint(1, 5)}
+        return booking.client, 'POST', '/api/submit-rating/', body
+
+    def run(self, requests, concurrency):
+        samples = []
+        lock = threading.Lock()
+
+        def worker(share):
+            clients = {}
+            try:
+                for user, method, path, data in share:
+                    client = clients.get(user)
+                    if client is None:
+                        client = clients[user] = Client()
+                        if user is not None:
+                            client.force_login(user)
+
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        if method == 'GET':
+                            response = client.get(path, data)
+                        else:
+                            response = client.post(path, json.dumps(data), content_type='application/json')
+                        elapsed = time.perf_counter() - start
+                    with lock:
+                        samples.append((elapsed, len(queries), response.status_code))
+            finally:
+                connections.close_all()
+
+        shares = [requests[i::concurrency] for i in range(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(worker, shares))
+        wall = time.perf_counter() - start
+        return summarize(samples, wall)
+
+
+def summarize(samples, wall):
+    latencies = sorted(s[0] * 1000 for s in samples)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[2] >= 400),
+        'p50_ms': round(cuts[49], 2),
+        'p95_ms': round(cuts[94], 2),
+        'p99_ms': round(cuts[98], 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries_per_request': round(statistics.fmean(s[1] for s in samples), 2),
+        'max_queries': max(s[1] for s in samples),
+        'throughput_rps': round(len(samples) / wall, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from servicehub_app.models import Booking, UserProfile
+
+PREFIX = 'bencha_'
+PROBE = {'lat': '-1.286389', 'lon': '36.817223'}
+
+
+class Command(BaseCommand):
+    help = ("Compare concurrent-request throughput of the JSON API through the WSGI (threads) "
+            "and ASGI (event loop) handler paths, in-process. Bench users are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        concurrency, total = options['concurrency'], options['requests']
+
+        User.objects.filter(username__startswith=PREFIX).delete()
+        provider = User.objects.create(username=f'{PREFIX}provider')
+        UserProfile.objects.create(user=provider, is_provider=True, is_verified=True, service_type='Plumbing',
+                                   latitude=PROBE['lat'], longitude=PROBE['lon'])
+        user = User.objects.create(username=f'{PREFIX}client')
+        for _ in range(20):
+            Booking.objects.create(client=user, provider=provider, description='bench')
+
+        endpoints = [('/api/nearby-providers/', PROBE, False), ('/api/my-bookings/', {}, True)]
+        try:
+            self.stdout.write(f"{'endpoint':<26} {'wsgi req/s':>11} {'asgi req/s':>11}")
+            for url, params, login in endpoints:
+                wsgi = self.run_wsgi(url, params, login and user, concurrency, total)
+                asgi = asyncio.run(self.run_asgi(url, params, login and user, concurrency, total))
+                self.stdout.write(f"{url:<26} {wsgi:>11.0f} {asgi:>11.0f}")
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def run_wsgi(self, url, params, user, concurrency, total):
+        def worker(count):
+            client = Client()
+            if user:
+                client.force_login(user)
+            try:
+                for _ in range(count):
+                    client.get(url, params)
+            finally:
+                connections.close_all()
+
+        shares = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(worker, shares))
+        return total / (time.perf_counter() - start)
+
+    async def run_asgi(self, url, params, user, concurrency, total):
+        client = AsyncClient()
+        if user:
+            await client.aforce_login(user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                await client.get(url, params)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return total / (time.perf_counter() - start)
@@ -0,0 +1,42 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from servicehub_app.geo import ProviderMatcher, calculate_distance
+
+PROBE_LAT, PROBE_LON = -1.286389, 36.817223
+
+
+class Command(BaseCommand):
+    help = "Compare scalar calculate_distance() against the vectorised ProviderMatcher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--radius', type=float, default=3.0)
+        parser.add_argument('--top', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        radius, top = options['radius'], options['top']
+
+        self.stdout.write(f"{'providers':>10} {'scalar ms':>10} {'vector ms':>10} {'speedup':>8}")
+        for size in options['sizes']:
+            lats = [PROBE_LAT + rng.uniform(-0.5, 0.5) for _ in range(size)]
+            lons = [PROBE_LON + rng.uniform(-0.5, 0.5) for _ in range(size)]
+
+            start = time.perf_counter()
+            scalar = sorted(
+                (dist, i) for i, (lat, lon) in enumerate(zip(lats, lons))
+                if (dist := calculate_distance(PROBE_LAT, PROBE_LON, lat, lon)) <= radius
+            )[:top]
+            scalar_ms = (time.perf_counter() - start) * 1000
+
+            # Array construction happens once per cache build, not per search
+            matcher = ProviderMatcher(range(size), lats, lons)
+            start = time.perf_counter()
+            vector = matcher.nearest(PROBE_LAT, PROBE_LON, radius, k=top)
+            vector_ms = (time.perf_counter() - start) * 1000
+
+            assert [i for _, i in scalar] == [i for i, _ in vector]
+            self.stdout.write(f"{size:>10} {scalar_ms:>10.1f} {vector_ms:>10.1f} {scalar_ms / vector_ms:>7.1f}x")
@@ -0,0 +1,99 @@
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from servicehub_app.geo import grid_cell
+from servicehub_app.models import UserProfile
+from servicehub_app.provider_cache import provider_cache
+from servicehub_app.views import find_nearby_providers
+
+# Probe point (Nairobi CBD) and the number of providers placed within reach of it
+PROBE_LAT, PROBE_LON = -1.286389, 36.817223
+LOCAL_PROVIDERS = 50
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark /api/nearby-providers/ latency as the provider table grows (changes are rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000, 1000000])
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        try:
+            with transaction.atomic():
+                self.run(rng, sorted(options['sizes']), options['requests'], options['batch_size'])
+                raise Rollback
+        except Rollback:
+            provider_cache.invalidate()
+            self.stdout.write("Benchmark data rolled back.")
+
+    def run(self, rng, sizes, requests, batch_size):
+        factory = RequestFactory()
+        request = factory.get('/api/nearby-providers/', {'lat': PROBE_LAT, 'lon': PROBE_LON})
+        # The view is async; async_to_sync runs its ORM calls on this thread, inside the rollback
+        view = async_to_sync(find_nearby_providers)
+
+        # A fixed cluster around the probe so the result size stays constant
+        self.add_providers(rng, LOCAL_PROVIDERS, batch_size, local=True)
+        total = LOCAL_PROVIDERS
+
+        self.stdout.write(f"{'providers':>10} {'rebuild ms':>10} {'mean ms':>10} {'p95 ms':>10} {'results':>8}")
+        for size in sizes:
+            if size > total:
+                self.add_providers(rng, size - total, batch_size, offset=total)
+                total = size
+
+            # bulk_create skips the signals, so invalidate and time the rebuild
+            provider_cache.invalidate()
+            start = time.perf_counter()
+            provider_cache.get()
+            rebuild = (time.perf_counter() - start) * 1000
+
+            timings = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = view(request)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results = response.content.count(b'"id"')
+            mean = sum(timings) / len(timings)
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(f"{total:>10} {rebuild:>10.0f} {mean:>10.2f} {p95:>10.2f} {results:>8}")
+
+    def add_providers(self, rng, count, batch_size, local=False, offset=0):
+        for start in range(0, count, batch_size):
+            n = min(batch_size, count - start)
+            prefix = 'bench_local' if local else 'bench'
+            users = User.objects.bulk_create([
+                User(username=f"{prefix}_{offset + start + i}", password='!')
+                for i in range(n)
+            ])
+            profiles = []
+            for user in users:
+                if local:
+                    lat = PROBE_LAT + rng.uniform(-0.02, 0.02)
+                    lon = PROBE_LON + rng.uniform(-0.02, 0.02)
+                else:
+                    # Everyone else is scattered across the continent
+                    lat = rng.uniform(-35.0, 37.0)
+                    lon = rng.uniform(-17.0, 51.0)
+                profile = UserProfile(
+                    user=user, is_provider=True, is_verified=True, service_type='Plumber',
+                    latitude=round(lat, 6), longitude=round(lon, 6),
+                )
+                # bulk_create skips save(), so fill the grid cell explicitly
+                profile.grid_cell = grid_cell(profile.latitude, profile.longitude)
+                profiles.append(profile)
+            UserProfile.objects.bulk_create(profiles)
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from servicehub_app.models import UserProfile
+
+PREFIX = 'benchw_'
+
+
+class Command(BaseCommand):
+    help = ("Hammer create_booking and submit_rating from concurrent threads and report write "
+            "throughput and lock errors. Point DB_NAME at a scratch database; bench users are "
+            "deleted afterwards. Compare runs with DB_SQLITE_TUNING=0 and =1.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=100, help="Requests per thread.")
+
+    def handle(self, *args, **options):
+        threads, per_thread = options['threads'], options['requests']
+        self.stdout.write(f"Database: {connection.vendor} {connection.settings_dict['NAME']} "
+                          f"options={connection.settings_dict['OPTIONS']}")
+
+        User.objects.filter(username__startswith=PREFIX).delete()
+        provider = User.objects.create(username=f'{PREFIX}provider')
+        profile = UserProfile.objects.create(user=provider, is_provider=True, is_verified=True)
+        clients = [User.objects.create(username=f'{PREFIX}client{i}') for i in range(threads)]
+
+        results = {'ok': 0, 'locked': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def worker(user):
+            client = Client()
+            client.force_login(user)
+            counts = {'ok': 0, 'locked': 0, 'failed': 0}
+            try:
+                for i in range(per_thread):
+                    if i % 2:
+                        url, body = '/api/submit-rating/', {'provider_username': provider.username, 'stars': i % 5 + 1}
+                    else:
+                        url, body = f'/api/book/{profile.id}/', {'description': 'bench'}
+                    try:
+                        response = client.post(url, json.dumps(body), content_type='application/json')
+                        counts['ok' if response.status_code == 200 else 'failed'] += 1
+                    except OperationalError as exc:
+                        counts['locked' if 'locked' in str(exc) else 'failed'] += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    for key, value in counts.items():
+                        results[key] += value
+
+        pool = [threading.Thread(target=worker, args=(user,)) for user in clients]
+        start = time.perf_counter()
+        # Measure the writes themselves, not how fast they start answering 429
+        with override_settings(RATE_LIMITS={}):
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        User.objects.filter(username__startswith=PREFIX).delete()
+        total = threads * per_thread
+        self.stdout.write(
+            f"{total} writes from {threads} threads in {elapsed:.2f}s: "
+            f"{results['ok'] / elapsed:.0f} successful writes/s, "
+            f"{results['locked']} 'database is locked' errors, {results['failed']} other failures"
+        )
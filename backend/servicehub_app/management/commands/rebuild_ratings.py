@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from servicehub_app.models import Rating, UserProfile
+from servicehub_app.provider_cache import provider_cache
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored provider rating aggregates from the Rating table and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, do not fix it.")
+
+    def handle(self, *args, **options):
+        totals = {
+            row['provider']: (row['total'], row['count'])
+            for row in Rating.objects.values('provider').annotate(total=Sum('stars'), count=Count('id'))
+        }
+
+        drifted = []
+        with transaction.atomic():
+            profiles = UserProfile.objects.select_for_update().select_related('user')
+            for profile in profiles.iterator(chunk_size=2000):
+                total, count = totals.get(profile.user_id, (0, 0))
+                if (profile.rating_sum, profile.rating_count) == (total, count):
+                    continue
+                drifted.append(profile)
+                self.stdout.write(
+                    f"{profile.user.username}: stored {profile.rating_sum}/{profile.rating_count}, "
+                    f"actual {total}/{count}"
+                )
+                profile.rating_sum = total
+                profile.rating_count = count
+                profile.rating_avg = total / count if count else 0
+
+            if drifted and not options['dry_run']:
+                UserProfile.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'rating_avg'])
+                provider_cache.invalidate()
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are in sync."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} provider(s) drifted (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} provider(s)."))
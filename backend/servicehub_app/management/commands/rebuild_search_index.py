@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from servicehub_app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the provider full-text search index from the profile and user tables."
+
+    def handle(self, *args, **options):
+        if search.backend() == 'fallback':
+            self.stdout.write(self.style.WARNING(
+                "No full-text index on this database; search uses LIKE matching and needs no rebuild."
+            ))
+            return
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = search.rebuild_index()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} providers ({search.backend()}) in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,44 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from servicehub_app.models import AVAILABILITY_FIELDS, ServiceAvailability, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Recount verified providers per service type and tile from the profiles and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, do not fix it.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            providers = UserProfile.objects.filter(is_provider=True, is_verified=True).values(*AVAILABILITY_FIELDS)
+            actual = Counter(UserProfile.availability_key(values) for values in providers.iterator(chunk_size=2000))
+            actual.pop(None, None)
+            stored = {
+                (row.tile_row, row.tile_col, row.service_type): row.provider_count
+                for row in ServiceAvailability.objects.iterator(chunk_size=2000)
+            }
+            drifted = {key for key in actual.keys() | stored.keys() if actual.get(key, 0) != stored.get(key, 0)}
+            for tile_row, tile_col, service_type in sorted(drifted):
+                key = (tile_row, tile_col, service_type)
+                self.stdout.write(
+                    f"{service_type} at {tile_row}:{tile_col}: stored {stored.get(key, 0)}, actual {actual.get(key, 0)}"
+                )
+
+            if drifted and not options['dry_run']:
+                ServiceAvailability.objects.all().delete()
+                ServiceAvailability.objects.bulk_create([
+                    ServiceAvailability(tile_row=tile_row, tile_col=tile_col, service_type=service_type,
+                                        provider_count=count)
+                    for (tile_row, tile_col, service_type), count in actual.items()
+                ], batch_size=1000)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Service availability counts are in sync."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} count(s) drifted (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} count(s)."))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from servicehub_app.commission import recompute_commissions
+from servicehub_app.models import Booking
+
+
+class Command(BaseCommand):
+    help = "Re-split booking totals into provider cut and platform fee using the current commission rates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service', help="Only re-price bookings for providers of this service type.")
+        parser.add_argument('--include-paid', action='store_true',
+                            help="Also re-price bookings already paid out. Their payout records keep the old "
+                                 "amounts, so reconcile those by hand afterwards.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['service']:
+            bookings = bookings.filter(provider__userprofile__service_type=options['service'])
+
+        start = time.perf_counter()
+        checked, changed = recompute_commissions(bookings, batch_size=options['batch_size'],
+                                                 include_paid=options['include_paid'])
+        elapsed = time.perf_counter() - start
+        rate = checked / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} bookings, updated {changed} in {elapsed:.1f}s ({rate:.0f} rows/s)."
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from servicehub_app.models import Booking, ProviderLedger
+
+
+class Command(BaseCommand):
+    help = "Compare every provider's earnings ledger with their bookings and report mismatches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Overwrite mismatched ledgers with the booking totals.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            actual = {
+                row['provider']: (row['earned'] or 0, row['paid'] or 0)
+                for row in Booking.objects.values('provider').annotate(
+                    earned=Sum('provider_cut', filter=Q(status__in=Booking.EARNED_STATUSES)),
+                    paid=Sum('provider_cut', filter=Q(is_paid_to_provider=True)),
+                )
+            }
+            ledgers = {
+                ledger.provider_id: ledger
+                for ledger in ProviderLedger.objects.select_for_update().select_related('provider')
+            }
+
+            mismatched = []
+            for provider_id in actual.keys() | ledgers.keys():
+                earned, paid = actual.get(provider_id, (0, 0))
+                ledger = ledgers.get(provider_id) or ProviderLedger(provider_id=provider_id)
+                if (ledger.total_earned, ledger.total_paid) == (earned, paid):
+                    continue
+                self.stdout.write(
+                    f"provider {provider_id}: ledger earned {ledger.total_earned} paid {ledger.total_paid}, "
+                    f"bookings earned {earned} paid {paid}"
+                )
+                ledger.total_earned, ledger.total_paid = earned, paid
+                mismatched.append(ledger)
+
+            if options['repair']:
+                for ledger in mismatched:
+                    ledger.save()
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS(f"All {len(actual)} provider ledgers match their bookings."))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(mismatched)} ledger(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(mismatched)} ledger(s) out of step; rerun with --repair to fix."))
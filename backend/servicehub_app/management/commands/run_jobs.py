@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from servicehub_app.jobs import claim_next, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (thumbnails and other deferred work)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when no job is due instead of polling for more.")
+        parser.add_argument('--max-jobs', type=int, help="Exit after running this many jobs.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to sleep when no job is due.")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Requeue jobs left running for this many seconds.")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        requeued = requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs")
+
+        ran = 0
+        while options['max_jobs'] is None or ran < options['max_jobs']:
+            job = claim_next()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                requeue_stale(stale_after)
+                continue
+
+            job = run_job(job)
+            ran += 1
+            style = self.style.SUCCESS if job.status == 'done' else self.style.WARNING
+            self.stdout.write(style(
+                f"{job}: {job.status} in {job.duration.total_seconds():.2f}s (attempt {job.attempts})"
+            ))
+        self.stdout.write(f"Ran {ran} jobs.")
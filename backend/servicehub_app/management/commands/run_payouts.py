@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from servicehub_app.payouts import (
+    DEFAULT_CHUNK_SIZE, payable_bookings, process_batch, start_batch, unfinished_batches,
+)
+
+
+class Command(BaseCommand):
+    help = "Pay providers for completed bookings in chunked, resumable payout batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--resume-only', action='store_true',
+                            help="Finish interrupted batches without starting a new one.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        batches = list(unfinished_batches())
+        for batch in batches:
+            self.stdout.write(f"Resuming {batch}")
+        if not options['resume_only'] and payable_bookings().exists():
+            batches.append(start_batch())
+
+        if not batches:
+            self.stdout.write("Nothing to pay out.")
+            return
+
+        for batch in batches:
+            stats = process_batch(batch, chunk_size=options['chunk_size'], progress=self.progress)
+            rate = stats['paid'] / stats['elapsed'] if stats['elapsed'] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"{batch}: paid {stats['paid']} bookings, KES {stats['amount']}, "
+                f"in {stats['elapsed']:.1f}s ({rate:.0f} bookings/s)"
+            ))
+
+    def progress(self, stats):
+        if self.verbosity >= 2:
+            rate = (stats['claimed'] + stats['paid']) / stats['elapsed'] if stats['elapsed'] else 0
+            self.stdout.write(f"  claimed {stats['claimed']}, paid {stats['paid']} ({rate:.0f} rows/s)")
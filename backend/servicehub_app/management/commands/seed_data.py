@@ -0,0 +1,172 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from math import cos, radians
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from servicehub_app import search
+from servicehub_app.commission import split_amount
+from servicehub_app.geo import KM_PER_DEGREE, grid_cell
+from servicehub_app.models import Booking, ProviderLedger, Rating, ServiceAvailability, UserProfile
+from servicehub_app.provider_cache import provider_cache
+
+PREFIX = 'seed_'
+PASSWORD = 'servicehub-seed'
+
+# (name, latitude, longitude, share of users, spread in km): people cluster
+# around towns, most of them in Nairobi
+TOWNS = [
+    ('nairobi', -1.2864, 36.8172, 0.55, 8.0),
+    ('mombasa', -4.0435, 39.6682, 0.15, 5.0),
+    ('kisumu', -0.0917, 34.7680, 0.10, 4.0),
+    ('nakuru', -0.3031, 36.0800, 0.10, 4.0),
+    ('eldoret', 0.5143, 35.2698, 0.10, 3.0),
+]
+# The trades offered by apply_provider.html and the home page service filter
+SERVICES = ['Plumbing', 'Carpentry', 'Electrical', 'Laundry', 'Masonry']
+# Booking status mix: (status, paid out, weight)
+STATUSES = [
+    (Booking.Status.PENDING, False, 20), (Booking.Status.QUOTED, False, 15), (Booking.Status.ACCEPTED, False, 10),
+    (Booking.Status.COMPLETED, False, 25), (Booking.Status.PAID, True, 30),
+]
+
+
+class Command(BaseCommand):
+    help = (f"Generate providers, clients, bookings and ratings clustered around Kenyan towns. "
+            f"Seed users are named {PREFIX}* and share the password '{PASSWORD}'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--providers', type=int, default=1000)
+        parser.add_argument('--clients', type=int, default=5000)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--ratings', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=180, help="Spread bookings over this many days.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, for repeatable data sets.")
+        parser.add_argument('--clear', action='store_true', help="Delete earlier seed users and their data first.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=PREFIX).delete()
+            self.stdout.write(f"Cleared {deleted} rows from earlier seeds")
+
+        password = make_password(PASSWORD)
+        towns = [rng.choices(TOWNS, weights=[t[3] for t in TOWNS])[0] for _ in range(options['providers'])]
+        client_towns = [rng.choices(TOWNS, weights=[t[3] for t in TOWNS])[0] for _ in range(options['clients'])]
+
+        with transaction.atomic():
+            run = timezone.now().strftime('%Y%m%d%H%M%S')
+            providers = self.create_users(f'{PREFIX}p{run}_', len(towns), password, batch_size)
+            clients = self.create_users(f'{PREFIX}c{run}_', len(client_towns), password, batch_size)
+
+            profiles = []
+            for user, town in zip(providers, towns):
+                lat, lon = scatter(rng, town)
+                profiles.append(UserProfile(
+                    user=user, is_provider=True, is_verified=rng.random() < 0.9,
+                    service_type=rng.choice(SERVICES), phone_number=f'07{rng.randrange(10**8):08d}',
+                    bio=f'{town[0].title()} based, {rng.randint(1, 20)} years experience.',
+                    latitude=lat, longitude=lon, grid_cell=grid_cell(lat, lon),
+                ))
+            profiles += [UserProfile(user=user, is_provider=False) for user in clients]
+
+            by_town = {}
+            for user, town in zip(providers, towns):
+                by_town.setdefault(town[0], []).append(user)
+
+            bookings, ledgers = self.make_bookings(rng, options, clients, client_towns, by_town, profiles)
+            ratings = self.make_ratings(rng, options['ratings'], bookings)
+
+            # Aggregates that Booking.save() and Rating.save() would normally keep
+            stars = {}
+            for rating in ratings:
+                total, count = stars.get(rating.provider_id, (0, 0))
+                stars[rating.provider_id] = (total + rating.stars, count + 1)
+            for profile in profiles:
+                total, count = stars.get(profile.user_id, (0, 0))
+                profile.rating_sum, profile.rating_count = total, count
+                profile.rating_avg = total / count if count else 0
+
+            UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+            search.index_profiles([profile.pk for profile in profiles if profile.is_provider])
+            ServiceAvailability.record_profiles(profiles)
+            # bulk_create stamps auto_now(_add) fields with the current time,
+            # on the instances too, so put the spread-out dates back afterwards
+            dates = [b.created_at for b in bookings]
+            Booking.objects.bulk_create(bookings, batch_size=batch_size)
+            for booking, created in zip(bookings, dates):
+                booking.created_at = booking.updated_at = created
+            Booking.objects.bulk_update(bookings, ['created_at', 'updated_at'], batch_size=batch_size)
+            Rating.objects.bulk_create(ratings, batch_size=batch_size)
+            ProviderLedger.objects.bulk_create([
+                ProviderLedger(provider_id=provider_id, total_earned=earned, total_paid=paid)
+                for provider_id, (earned, paid) in ledgers.items()
+            ], batch_size=batch_size)
+
+        provider_cache.invalidate()
+        elapsed = time.perf_counter() - start
+        rows = len(providers) + len(clients) + len(profiles) + len(bookings) + len(ratings)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(providers)} providers, {len(clients)} clients, {len(bookings)} bookings and "
+            f"{len(ratings)} ratings in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)."
+        ))
+
+    def create_users(self, prefix, count, password, batch_size):
+        users = [User(username=f'{prefix}{i}', password=password, first_name=prefix.rstrip('_'), last_name=str(i))
+                 for i in range(count)]
+        return User.objects.bulk_create(users, batch_size=batch_size)
+
+    def make_bookings(self, rng, options, clients, client_towns, by_town, profiles):
+        services = {p.user_id: p.service_type for p in profiles if p.is_provider}
+        now = timezone.now()
+        bookings, ledgers = [], {}
+        if not clients or not by_town:
+            return bookings, ledgers
+        for _ in range(options['bookings']):
+            i = rng.randrange(len(clients))
+            # Clients book providers from their own town when there are any
+            nearby = by_town.get(client_towns[i][0]) or rng.choice(list(by_town.values()))
+            provider = rng.choice(nearby)
+            status, paid = rng.choices(STATUSES, weights=[s[2] for s in STATUSES])[0][:2]
+            created = now - timedelta(seconds=rng.randrange(options['days'] * 86400))
+            booking = Booking(client=clients[i], provider=provider, description='Seeded job',
+                              status=status, is_paid_to_provider=paid, created_at=created)
+            if status != Booking.Status.PENDING:
+                booking.total_amount = Decimal(rng.randrange(500, 20000, 50))
+                booking.provider_cut, booking.platform_fee = split_amount(booking.total_amount,
+                                                                          services[provider.pk])
+            if paid:
+                booking.payout_date = created + timedelta(days=1)
+
+            _, earned, paid_out = booking.ledger_contribution()
+            total_earned, total_paid = ledgers.get(provider.pk, (0, 0))
+            ledgers[provider.pk] = (total_earned + earned, total_paid + paid_out)
+            bookings.append(booking)
+        return bookings, ledgers
+
+    def make_ratings(self, rng, count, bookings):
+        # One rating per client/provider pair that has a completed booking
+        pairs = list({(b.client_id, b.provider_id) for b in bookings if b.status in Booking.EARNED_STATUSES})
+        rng.shuffle(pairs)
+        return [
+            Rating(client_id=client_id, provider_id=provider_id, stars=rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 8, 10])[0])
+            for client_id, provider_id in pairs[:count]
+        ]
+
+
+def scatter(rng, town):
+    """A point around the town, normally distributed with its spread in km."""
+    _, lat, lon, _, spread_km = town
+    dlat = rng.gauss(0, spread_km) / KM_PER_DEGREE
+    dlon = rng.gauss(0, spread_km) / (KM_PER_DEGREE * cos(radians(lat)))
+    return round(Decimal(lat + dlat), 6), round(Decimal(lon + dlon), 6)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.11 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+def populate_grid_cells(apps, schema_editor):
+    from servicehub_app.geo import grid_cell
+
+    UserProfile = apps.get_model('servicehub_app', 'UserProfile')
+    profiles = UserProfile.objects.exclude(latitude=None).exclude(longitude=None)
+    for profile in profiles.iterator():
+        profile.grid_cell = grid_cell(profile.latitude, profile.longitude)
+        profile.save(update_fields=['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0011_feedback_clientfeedback_providerfeedback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='grid_cell',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(populate_grid_cells, migrations.RunPython.noop),
+    ]
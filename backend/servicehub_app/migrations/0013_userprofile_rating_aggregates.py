@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:48
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    UserProfile = apps.get_model('servicehub_app', 'UserProfile')
+    Rating = apps.get_model('servicehub_app', 'Rating')
+    totals = Rating.objects.values('provider').annotate(total=Sum('stars'), count=Count('id'))
+    for row in totals:
+        UserProfile.objects.filter(user_id=row['provider']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating_avg=row['total'] / row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0012_userprofile_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
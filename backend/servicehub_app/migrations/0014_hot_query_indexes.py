@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0013_userprofile_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client', '-created_at'], name='booking_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_paid_to_provider', False)), fields=['provider', '-created_at'], name='booking_provider_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_paid_to_provider', True)), fields=['provider', '-created_at'], name='booking_provider_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['provider', 'status'], name='booking_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('is_provider', True), ('is_verified', True)), fields=['grid_cell'], name='profile_verified_cell_idx'),
+        ),
+    ]
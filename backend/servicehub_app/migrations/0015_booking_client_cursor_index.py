@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0014_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_client_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client', '-created_at', '-id'], name='booking_client_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def populate_ledgers(apps, schema_editor):
+    Booking = apps.get_model('servicehub_app', 'Booking')
+    ProviderLedger = apps.get_model('servicehub_app', 'ProviderLedger')
+    totals = Booking.objects.values('provider').annotate(
+        earned=Sum('provider_cut', filter=Q(status='completed')),
+        paid=Sum('provider_cut', filter=Q(is_paid_to_provider=True)),
+    )
+    ProviderLedger.objects.bulk_create([
+        ProviderLedger(provider_id=row['provider'], total_earned=row['earned'] or 0, total_paid=row['paid'] or 0)
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0015_booking_client_cursor_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_earned', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(populate_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0016_providerledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('claiming', 'Claiming bookings'), ('paying', 'Paying providers'), ('completed', 'Completed')], default='claiming', max_length=10)),
+                ('cutoff', models.DateTimeField()),
+                ('booking_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Payout Batches',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='payout_batch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='servicehub_app.payoutbatch'),
+        ),
+        migrations.CreateModel(
+            name='ProviderPayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('booking_count', models.PositiveIntegerField(default=0)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='servicehub_app.payoutbatch')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('batch', 'provider')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def queue_thumbnails(apps, schema_editor):
+    # Existing photos get thumbnails the next time run_jobs runs
+    UserProfile = apps.get_model('servicehub_app', 'UserProfile')
+    Job = apps.get_model('servicehub_app', 'Job')
+    photos = UserProfile.objects.exclude(profile_photo='').exclude(profile_photo=None).values_list('pk', 'profile_photo')
+    Job.objects.bulk_create([
+        Job(task='servicehub_app.thumbnails.generate_thumbnails', kwargs={'profile_id': pk, 'photo': photo})
+        for pk, photo in photos
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0018_booking_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='thumbnail_256',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='provider_photos/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='thumbnail_96',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='provider_photos/thumbs/'),
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['run_after', 'id'], name='job_queued_idx')],
+            },
+        ),
+        migrations.RunPython(queue_thumbnails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Kept outside the model state: the index is maintained with raw SQL (see search.py)
+FTS_TABLE = 'servicehub_app_providersearch'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            # prefix='2 3' keeps extra index entries so short prefix queries don't scan terms
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"name, service_type, bio, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5: search.py falls back to LIKE matching
+            return
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, service_type, bio) "
+            f"SELECT p.id, u.first_name || ' ' || u.last_name || ' ' || u.username, "
+            f"COALESCE(p.service_type, ''), COALESCE(p.bio, '') "
+            f"FROM servicehub_app_userprofile p JOIN auth_user u ON u.id = p.user_id WHERE p.is_provider"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE servicehub_app_userprofile ADD COLUMN search_vector tsvector")
+        schema_editor.execute(
+            "UPDATE servicehub_app_userprofile p SET search_vector = "
+            "setweight(to_tsvector('simple', u.first_name || ' ' || u.last_name || ' ' || u.username), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE(p.service_type, '')), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE(p.bio, '')), 'B') "
+            "FROM auth_user u WHERE u.id = p.user_id AND p.is_provider"
+        )
+        schema_editor.execute(
+            "CREATE INDEX profile_search_vector_idx ON servicehub_app_userprofile USING gin (search_vector)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("ALTER TABLE servicehub_app_userprofile DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0019_provider_thumbnails_and_jobs'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
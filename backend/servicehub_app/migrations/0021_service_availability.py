@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:34
+
+from collections import Counter
+
+from django.db import migrations, models
+
+from servicehub_app.geo import tile
+
+
+def count_providers(apps, schema_editor):
+    UserProfile = apps.get_model('servicehub_app', 'UserProfile')
+    ServiceAvailability = apps.get_model('servicehub_app', 'ServiceAvailability')
+    providers = UserProfile.objects.filter(
+        is_provider=True, is_verified=True, latitude__isnull=False, longitude__isnull=False,
+    ).exclude(service_type=None).exclude(service_type='').values_list('latitude', 'longitude', 'service_type')
+    counts = Counter((*tile(lat, lon), service.strip().lower()) for lat, lon, service in providers.iterator())
+    ServiceAvailability.objects.bulk_create([
+        ServiceAvailability(tile_row=row, tile_col=col, service_type=service, provider_count=count)
+        for (row, col, service), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0020_provider_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tile_row', models.IntegerField()),
+                ('tile_col', models.IntegerField()),
+                ('service_type', models.CharField(max_length=100)),
+                ('provider_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Service availability',
+                'constraints': [models.UniqueConstraint(fields=('tile_row', 'tile_col', 'service_type'), name='availability_tile_service_uniq')],
+            },
+        ),
+        migrations.RunPython(count_providers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+STATUS_CHOICES = [(1, 'Pending'), (2, 'Quoted'), (3, 'Accepted'), (4, 'completed'), (5, 'paid')]
+# Old free-form values; anything unrecognised starts over as Pending
+STATUS_CODES = {'pending': 1, 'quoted': 2, 'accepted': 3, 'completed': 4}
+
+
+def to_codes(apps, schema_editor):
+    Booking = apps.get_model('servicehub_app', 'Booking')
+    for name, code in STATUS_CODES.items():
+        Booking.objects.filter(status__iexact=name).update(status_code=code)
+    Booking.objects.filter(status_code=4, is_paid_to_provider=True).update(status_code=5)
+
+
+def to_names(apps, schema_editor):
+    Booking = apps.get_model('servicehub_app', 'Booking')
+    for code, name in STATUS_CHOICES:
+        Booking.objects.filter(status_code=code).update(status='completed' if code == 5 else name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servicehub_app', '0021_service_availability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_provider_status_idx',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=1),
+        ),
+        migrations.RunPython(to_codes, to_names),
+        migrations.RemoveField(
+            model_name='booking',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='booking',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['provider', 'status'], name='booking_provider_status_idx'),
+        ),
+        migrations.CreateModel(
+            name='BookingTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.PositiveSmallIntegerField(choices=STATUS_CHOICES)),
+                ('to_status', models.PositiveSmallIntegerField(choices=STATUS_CHOICES)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                            related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                              related_name='transitions', to='servicehub_app.booking')),
+            ],
+        ),
+    ]
@@ -1,6 +1,19 @@
-from django.db import models
+from collections import Counter
+from functools import partial
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .commission import ZERO, has_service_rates, split_amount, to_money
+from .geo import grid_cell, tile
+from .provider_cache import provider_cache
+
+# Profile fields that decide which ServiceAvailability count a provider is in
+AVAILABILITY_FIELDS = ('is_provider', 'is_verified', 'service_type', 'latitude', 'longitude')
+
 
 class UserProfile(models.Model):
     # Link to the base Django User account
@@ -15,42 +28,434 @@ class UserProfile(models.Model):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     bio = models.TextField(blank=True, null=True)
     profile_photo = models.ImageField(upload_to='provider_photos/', null=True, blank=True)
+    # Small WebP copies of profile_photo for listings, made in the background (see thumbnails.py)
+    thumbnail_96 = models.ImageField(upload_to='provider_photos/thumbs/', null=True, blank=True, editable=False)
+    thumbnail_256 = models.ImageField(upload_to='provider_photos/thumbs/', null=True, blank=True, editable=False)
     
     # Location for the 3km radius matching
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Spatial index key derived from latitude/longitude (see geo.grid_cell)
+    grid_cell = models.CharField(max_length=32, null=True, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Provider cache rebuild and any search on verified providers
+            models.Index(
+                fields=['grid_cell'], name='profile_verified_cell_idx',
+                condition=models.Q(is_provider=True, is_verified=True),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_photo = instance.__dict__.get('profile_photo') or None
+        if all(field in instance.__dict__ for field in AVAILABILITY_FIELDS):
+            instance._stored_availability = {field: instance.__dict__[field] for field in AVAILABILITY_FIELDS}
+        return instance
+
+    @staticmethod
+    def availability_key(values):
+        """(tile row, tile column, service type) a provider is counted under, or None."""
+        if not (values.get('is_provider') and values.get('is_verified') and values.get('service_type')):
+            return None
+        location = tile(values.get('latitude'), values.get('longitude'))
+        return location and (*location, values['service_type'].strip().lower())
+
+    def save(self, *args, **kwargs):
+        # Keep the grid cell in sync whenever the coordinates change
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = update_fields = set(update_fields) | {'grid_cell'}
+
+        # A new photo makes the old thumbnails stale until the job replaces them
+        photo_changed = (self.profile_photo.name or None) != getattr(self, '_stored_photo', None)
+        stale_thumbnails = []
+        if photo_changed:
+            stale_thumbnails = [(f.storage, f.name) for f in (self.thumbnail_96, self.thumbnail_256) if f]
+            self.thumbnail_96 = self.thumbnail_256 = None
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'thumbnail_96', 'thumbnail_256'}
+        # A provider moves between availability counts when the saved fields change its key
+        track = update_fields is None or not set(AVAILABILITY_FIELDS).isdisjoint(update_fields)
+        if track:
+            stored = {} if self._state.adding else getattr(self, '_stored_availability', None)
+            if stored is None:
+                # Loaded with some of the fields deferred
+                stored = UserProfile.objects.filter(pk=self.pk).values(*AVAILABILITY_FIELDS).first() or {}
+            current = {
+                field: getattr(self, field) if update_fields is None or field in update_fields else stored.get(field)
+                for field in AVAILABILITY_FIELDS
+            }
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if photo_changed and self.profile_photo:
+                Job.enqueue('servicehub_app.thumbnails.generate_thumbnails',
+                            profile_id=self.pk, photo=self.profile_photo.name)
+            for storage, name in stale_thumbnails:
+                # Files aren't transactional, so only once the cleared fields are committed
+                transaction.on_commit(partial(storage.delete, name))
+            if track:
+                before, after = self.availability_key(stored), self.availability_key(current)
+                if before != after:
+                    ServiceAvailability.record(before, -1)
+                    ServiceAvailability.record(after, 1)
+        self._stored_photo = self.profile_photo.name or None
+        if track:
+            self._stored_availability = current
+
+    # Rating aggregates, maintained by Rating.save() and its post_delete signal (see rebuild_ratings)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
 
     def get_rating(self):
-        from django.db.models import Avg
-        avg = Rating.objects.filter(provider=self.user).aggregate(Avg('stars'))['stars__avg']
-        return round(avg, 1) if avg else 0
+        return round(self.rating_avg, 1) if self.rating_count else 0
 
     def get_review_count(self):
-        return Rating.objects.filter(provider=self.user).count()
+        return self.rating_count
+
+    @classmethod
+    def apply_rating_change(cls, provider_id, stars_delta, count_delta):
+        # Single UPDATE using the column values already in the row, so
+        # concurrent ratings for the same provider cannot overwrite each other
+        new_sum = F('rating_sum') + stars_delta
+        new_count = F('rating_count') + count_delta
+        cls.objects.filter(user_id=provider_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            rating_avg=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, 0), Value(0.0)),
+        )
+        provider_cache.refresh([provider_id])
     
     def __str__(self):
         return f"{self.user.username} - {'Provider' if self.is_provider else 'Client'}"
 
 
 class Booking(models.Model):
+    class Status(models.IntegerChoices):
+        # Labels are what the API and templates show
+        PENDING = 1, 'Pending'
+        QUOTED = 2, 'Quoted'
+        ACCEPTED = 3, 'Accepted'
+        COMPLETED = 4, 'completed'
+        PAID = 5, 'paid'
+
+    # action: (statuses it may start from, status it leads to). A quote can
+    # be revised until the client accepts it.
+    TRANSITIONS = {
+        'quote': ({Status.PENDING, Status.QUOTED}, Status.QUOTED),
+        'accept': ({Status.QUOTED}, Status.ACCEPTED),
+        'complete': ({Status.ACCEPTED}, Status.COMPLETED),
+        'pay': ({Status.COMPLETED}, Status.PAID),
+    }
+    # Statuses whose provider_cut counts as earned
+    EARNED_STATUSES = (Status.COMPLETED, Status.PAID)
+
     client = models.ForeignKey(User, related_name='bookings', on_delete=models.CASCADE)
     provider = models.ForeignKey(User, related_name='jobs', on_delete=models.CASCADE)
     description = models.TextField(help_text="Describe the issue or service needed")
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     provider_cut = models.DecimalField(max_digits=10, decimal_places=2, editable=False, null=True)
     platform_fee = models.DecimalField(max_digits=10, decimal_places=2, editable=False, null=True)
-    status = models.CharField(max_length=20, default='Pending')
+    # Change it with transition(), not save(), so concurrent requests can't
+    # overwrite each other and every change is logged
+    status = models.PositiveSmallIntegerField(choices=Status.choices, default=Status.PENDING)
 
     is_paid_to_provider = models.BooleanField(default=False)
     payout_date = models.DateTimeField(null=True, blank=True)
+    payout_batch = models.ForeignKey('PayoutBatch', related_name='bookings', on_delete=models.SET_NULL,
+                                     null=True, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every change, including the bulk update() paths, so clients
+    # can tell whether their booking list changed (see get_my_bookings)
+    updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
+    class Meta:
+        indexes = [
+            # get_my_bookings: a client's bookings, newest first, with id as
+            # the tie-break its pagination cursor relies on
+            models.Index(fields=['client', '-created_at', '-id'], name='booking_client_recent_idx'),
+            # get_my_bookings: the client's latest change, read from the index alone
+            models.Index(fields=['client', 'updated_at'], name='booking_client_updated_idx'),
+            # provider_dashboard: active jobs and payout history, newest first.
+            # Partial, because Django renders is_paid_to_provider=False as
+            # "NOT is_paid_to_provider", which a plain composite index can't seek
+            models.Index(
+                fields=['provider', '-created_at'], name='booking_provider_unpaid_idx',
+                condition=models.Q(is_paid_to_provider=False),
+            ),
+            models.Index(
+                fields=['provider', '-created_at'], name='booking_provider_paid_idx',
+                condition=models.Q(is_paid_to_provider=True),
+            ),
+            # provider_dashboard: earnings totals by status
+            models.Index(fields=['provider', 'status'], name='booking_provider_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_earnings = instance.ledger_contribution()
+        return instance
+
+    def ledger_contribution(self):
+        """(provider_id, earned, paid) this booking adds to the provider's ledger."""
+        cut = to_money(self.__dict__.get('provider_cut'))
+        earned = cut if self.__dict__.get('status') in self.EARNED_STATUSES else ZERO
+        paid = cut if self.__dict__.get('is_paid_to_provider') else ZERO
+        return self.__dict__.get('provider_id'), earned, paid
+
+    def split_total(self):
         if self.total_amount:
-            self.provider_cut = float(self.total_amount) * 0.90
-            self.platform_fee = float(self.total_amount) * 0.10
-        super().save(*args, **kwargs)
+            # Exact Decimal split using settings.PLATFORM_COMMISSION_RATES
+            service_type = None
+            if has_service_rates():
+                service_type = UserProfile.objects.filter(user_id=self.provider_id).values_list(
+                    'service_type', flat=True).first()
+            self.total_amount = to_money(self.total_amount)
+            self.provider_cut, self.platform_fee = split_amount(self.total_amount, service_type)
+
+    def save(self, *args, **kwargs):
+        self.split_total()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+            if 'total_amount' in update_fields:
+                kwargs['update_fields'] |= {'provider_cut', 'platform_fee'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._record_ledger_change()
+
+    def _record_ledger_change(self):
+        previous = getattr(self, '_stored_earnings', (None, ZERO, ZERO))
+        current = self.ledger_contribution()
+        # Apply only the change, e.g. completion or a re-quote of a completed job
+        if previous[0] is not None and previous[0] != current[0]:
+            ProviderLedger.record(previous[0], -previous[1], -previous[2])
+            previous = (current[0], ZERO, ZERO)
+        ProviderLedger.record(current[0], current[1] - previous[1], current[2] - previous[2])
+        self._stored_earnings = current
+
+    def transition(self, action, actor=None, **changes):
+        """Apply a state machine action, plus any field ``changes``, in one conditional UPDATE.
+
+        The UPDATE only matches while the row still has the status this
+        instance was loaded with, so of two concurrent requests one wins and
+        the other gets False without changing anything. Only the status,
+        ``changes`` and updated_at are written.
+        """
+        sources, target = self.TRANSITIONS[action]
+        if self.status not in sources:
+            return False
+        previous_status = self.status
+        for field, value in changes.items():
+            setattr(self, field, value)
+        if 'total_amount' in changes:
+            self.split_total()
+            changes.update(total_amount=self.total_amount, provider_cut=self.provider_cut,
+                           platform_fee=self.platform_fee)
+        self.status, self.updated_at = target, timezone.now()
+
+        with transaction.atomic():
+            updated = Booking.objects.filter(pk=self.pk, status=previous_status).update(
+                status=target, updated_at=self.updated_at, **changes,
+            )
+            if not updated:
+                # Someone else moved it first; show their version
+                self.refresh_from_db()
+                self._stored_earnings = self.ledger_contribution()
+                return False
+            BookingTransition.objects.create(booking=self, from_status=previous_status, to_status=target, actor=actor)
+            self._record_ledger_change()
+        return True
+
+
+class BookingTransition(models.Model):
+    """Audit log entry for one Booking status change."""
+    booking = models.ForeignKey(Booking, related_name='transitions', on_delete=models.CASCADE)
+    from_status = models.PositiveSmallIntegerField(choices=Booking.Status.choices)
+    to_status = models.PositiveSmallIntegerField(choices=Booking.Status.choices)
+    # None for system changes such as payouts
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Booking #{self.booking_id}: {self.get_from_status_display()} -> {self.get_to_status_display()}"
+
+
+class ProviderLedger(models.Model):
+    """Running earnings totals per provider, kept in step with their bookings.
+
+    total_earned matches the provider_cut of completed bookings and total_paid
+    the provider_cut of bookings paid out; reconcile_ledger checks both.
+    """
+    provider = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger')
+    total_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def pending_payout(self):
+        return self.total_earned - self.total_paid
+
+    @classmethod
+    def record(cls, provider_id, earned=0, paid=0, create=True):
+        if not earned and not paid:
+            return
+        changes = {
+            'total_earned': F('total_earned') + earned,
+            'total_paid': F('total_paid') + paid,
+            'updated_at': timezone.now(),
+        }
+        if cls.objects.filter(provider_id=provider_id).update(**changes) or not create:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(provider_id=provider_id, total_earned=earned, total_paid=paid)
+        except IntegrityError:
+            # Someone else created the row first
+            cls.objects.filter(provider_id=provider_id).update(**changes)
+
+    def __str__(self):
+        return f"{self.provider.username} ledger"
+
+class ServiceAvailability(models.Model):
+    """Verified providers per service type and geo.tile (~1km square).
+
+    Kept in step by UserProfile.save() and profile deletion; bulk writers
+    call record_profiles(), and rebuild_service_availability recounts it all.
+    """
+    tile_row = models.IntegerField()
+    tile_col = models.IntegerField()
+    # Lowercased, so "Plumber" and "plumber " count together
+    service_type = models.CharField(max_length=100)
+    provider_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Service availability"
+        constraints = [
+            # Also the index behind the tile range lookups
+            models.UniqueConstraint(fields=['tile_row', 'tile_col', 'service_type'], name='availability_tile_service_uniq'),
+        ]
+
+    @classmethod
+    def record(cls, key, delta):
+        if key is None or not delta:
+            return
+        tile_row, tile_col, service_type = key
+        rows = cls.objects.filter(tile_row=tile_row, tile_col=tile_col, service_type=service_type)
+        if rows.update(provider_count=F('provider_count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(tile_row=tile_row, tile_col=tile_col, service_type=service_type,
+                                   provider_count=delta)
+        except IntegrityError:
+            # Someone else created the row first
+            rows.update(provider_count=F('provider_count') + delta)
+
+    @classmethod
+    def record_profiles(cls, profiles, delta=1):
+        """Count in (or out, with delta=-1) profiles written without save(), e.g. by bulk_create()."""
+        counts = Counter(UserProfile.availability_key(profile.__dict__) for profile in profiles)
+        for key, count in counts.items():
+            cls.record(key, count * delta)
+
+    def __str__(self):
+        return f"{self.service_type} at {self.tile_row}:{self.tile_col}: {self.provider_count}"
+
+
+class PayoutBatch(models.Model):
+    """One payout run; bookings are claimed into it, then paid in chunks."""
+    STATUS_CHOICES = (
+        ('claiming', 'Claiming bookings'),
+        ('paying', 'Paying providers'),
+        ('completed', 'Completed'),
+    )
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='claiming')
+    # Only bookings created up to the cutoff are claimed, so a resumed run
+    # does not sweep in work completed after it started
+    cutoff = models.DateTimeField()
+    booking_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Payout Batches"
+
+    def __str__(self):
+        return f"Payout #{self.pk} ({self.get_status_display()})"
+
+
+class ProviderPayout(models.Model):
+    batch = models.ForeignKey(PayoutBatch, related_name='payouts', on_delete=models.CASCADE)
+    provider = models.ForeignKey(User, related_name='payouts', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    booking_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('batch', 'provider')
+
+    def __str__(self):
+        return f"{self.provider.username}: KES {self.amount}"
+
+
+class Job(models.Model):
+    """A deferred function call, run by the run_jobs command (see jobs.py)."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    # Dotted path of the function, called with kwargs
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # The runner's "next due job" lookup
+            models.Index(fields=['run_after', 'id'], name='job_queued_idx', condition=models.Q(status='queued')),
+        ]
+
+    @classmethod
+    def enqueue(cls, task, delay=None, max_attempts=3, **kwargs):
+        """Queue ``task`` (a function or its dotted path) to be called with kwargs.
+
+        The job row is part of the current transaction, so it only becomes
+        visible to the runner if the caller's work commits.
+        """
+        if callable(task):
+            task = f"{task.__module__}.{task.__qualname__}"
+        return cls.objects.create(
+            task=task, kwargs=kwargs, max_attempts=max_attempts,
+            run_after=timezone.now() + delay if delay else timezone.now(),
+        )
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+    def __str__(self):
+        return f"{self.task} #{self.pk}"
+
 
 class Provider(UserProfile):
     class Meta:
@@ -74,6 +479,24 @@ class Rating(models.Model):
     class Meta:
         unique_together = ('provider', 'client')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so an edit only applies the difference
+        instance._stored_stars = instance.__dict__.get('stars')
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, '_stored_stars', None)
+        self.stars = int(self.stars)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous is None:
+                UserProfile.apply_rating_change(self.provider_id, self.stars, 1)
+            elif self.stars != previous:
+                UserProfile.apply_rating_change(self.provider_id, self.stars - previous, 0)
+        self._stored_stars = self.stars
+
 
 class Feedback(models.Model):
     USER_TYPES = (
@@ -0,0 +1,132 @@
+import time
+
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Booking, BookingTransition, PayoutBatch, ProviderLedger, ProviderPayout
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def payable_bookings():
+    """Completed bookings that are unpaid and not claimed by any batch."""
+    return Booking.objects.filter(status=Booking.Status.COMPLETED, is_paid_to_provider=False, payout_batch=None)
+
+
+def start_batch(bookings=None):
+    """Open a payout batch.
+
+    With ``bookings`` (e.g. an admin selection) the payable ones are claimed
+    straight away; otherwise process_batch() claims every payable booking
+    created before the batch's cutoff.
+    """
+    with transaction.atomic():
+        batch = PayoutBatch.objects.create(cutoff=timezone.now())
+        if bookings is not None:
+            claimed = bookings.filter(pk__in=payable_bookings().values('pk'))
+            claimed.update(payout_batch=batch)
+            batch.status = 'paying'
+            batch.save(update_fields=['status'])
+    return batch
+
+
+def unfinished_batches():
+    return PayoutBatch.objects.exclude(status='completed').order_by('pk')
+
+
+def process_batch(batch, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Claim and pay a batch in chunks, each chunk in its own transaction.
+
+    Every chunk commits on its own, so SQLite is never locked for more than
+    one chunk and a crashed run can be resumed by calling this again.
+    ``progress`` is called with a stats dict after each chunk. Returns the
+    final stats: claimed, paid, amount and elapsed seconds.
+    """
+    stats = {'claimed': 0, 'paid': 0, 'amount': 0, 'elapsed': 0.0}
+    start = time.perf_counter()
+
+    while batch.status == 'claiming':
+        with transaction.atomic():
+            ids = list(
+                payable_bookings().filter(created_at__lte=batch.cutoff)
+                .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if ids:
+                stats['claimed'] += Booking.objects.filter(pk__in=ids, payout_batch=None).update(payout_batch=batch)
+            else:
+                batch.status = 'paying'
+                batch.save(update_fields=['status'])
+        _report(stats, start, progress)
+
+    while batch.status == 'paying':
+        with transaction.atomic():
+            ids = list(
+                batch.bookings.filter(status=Booking.Status.COMPLETED, is_paid_to_provider=False)
+                .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if ids:
+                paid, amount = _pay_chunk(batch, ids)
+                stats['paid'] += paid
+                stats['amount'] += amount
+            else:
+                # Release anything that stopped being payable after it was claimed
+                batch.bookings.filter(is_paid_to_provider=False).update(payout_batch=None)
+                batch.status = 'completed'
+                batch.completed_at = timezone.now()
+                batch.save(update_fields=['status', 'completed_at'])
+        _report(stats, start, progress)
+
+    return stats
+
+
+def _pay_chunk(batch, ids):
+    # The same completed -> paid transition as Booking.transition('pay'), a chunk at a time
+    # Lock the claimed bookings that are still completed; only those move
+    # to paid, get totalled and are logged
+    ids = list(Booking.objects.select_for_update().filter(
+        pk__in=ids, status=Booking.Status.COMPLETED).values_list('pk', flat=True))
+    chunk = Booking.objects.filter(pk__in=ids)
+    totals = list(chunk.values('provider').annotate(amount=Sum('provider_cut'), count=Count('id')))
+    now = timezone.now()
+    # Claiming only sets payout_batch, which no client sees, so only
+    # payment bumps updated_at
+    chunk.update(
+        status=Booking.Status.PAID, is_paid_to_provider=True, payout_date=now, updated_at=now,
+    )
+    BookingTransition.objects.bulk_create([
+        BookingTransition(booking_id=pk, from_status=Booking.Status.COMPLETED, to_status=Booking.Status.PAID)
+        for pk in ids
+    ])
+
+    paid = amount = 0
+    for row in totals:
+        provider_amount = row['amount'] or 0
+        _add_provider_payout(batch, row['provider'], provider_amount, row['count'])
+        # update() bypasses Booking.save(), so credit the ledger here
+        ProviderLedger.record(row['provider'], paid=provider_amount)
+        paid += row['count']
+        amount += provider_amount
+
+    PayoutBatch.objects.filter(pk=batch.pk).update(
+        booking_count=F('booking_count') + paid,
+        total_amount=F('total_amount') + amount,
+    )
+    return paid, amount
+
+
+def _add_provider_payout(batch, provider_id, amount, count):
+    changes = {'amount': F('amount') + amount, 'booking_count': F('booking_count') + count}
+    if ProviderPayout.objects.filter(batch=batch, provider_id=provider_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ProviderPayout.objects.create(batch=batch, provider_id=provider_id, amount=amount, booking_count=count)
+    except IntegrityError:
+        ProviderPayout.objects.filter(batch=batch, provider_id=provider_id).update(**changes)
+
+
+def _report(stats, start, progress):
+    stats['elapsed'] = time.perf_counter() - start
+    if progress:
+        progress(stats)
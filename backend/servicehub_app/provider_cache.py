@@ -0,0 +1,220 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .geo import ProviderMatcher, bounding_box, cells_in_box
+
+# Bumped on every invalidation so other worker processes sharing the cache
+# backend notice that their snapshot is stale
+VERSION_KEY = 'servicehub:provider-cache-version'
+# Rating, name and photo changes only need their own rows re-read. Each
+# refresh takes the next number from PATCHES_KEY and stores its user ids
+# under PATCH_KEY, so every worker can re-read exactly the rows it missed.
+PATCHES_KEY = 'servicehub:provider-cache-patches'
+PATCH_KEY = 'servicehub:provider-cache-patch:{}'
+# A worker further behind than this rebuilds instead
+MAX_PATCHES = 1000
+
+
+def first_url(*files):
+    for f in files:
+        if f:
+            return f.url
+    return None
+
+
+def snapshot_row(p):
+    return {
+        'id': p.id,
+        'name': p.user.get_full_name() or p.user.username,
+        'service': p.service_type,
+        'phone': p.phone_number,
+        # Thumbnails, since the original upload can be megabytes; the
+        # original is only shown until run_jobs has made them
+        'photo': first_url(p.thumbnail_256, p.profile_photo),
+        'thumbnail': first_url(p.thumbnail_96, p.profile_photo),
+        'rating': p.get_rating(),
+        'review_count': p.get_review_count(),
+    }
+
+
+class ProviderSnapshot:
+    """Verified provider locations and display fields, grouped by grid cell."""
+
+    def __init__(self, profiles):
+        profiles = sorted(profiles, key=lambda p: p.grid_cell)
+        self.rows = [snapshot_row(p) for p in profiles]
+        self.rows_by_id = {row['id']: row for row in self.rows}
+        self.positions = {p.id: position for position, p in enumerate(profiles)}
+        # Identifies the snapshot's contents, so workers that built the same
+        # data hand out the same ETags (patched snapshots get their own)
+        self.digest = hashlib.sha1(repr((
+            self.rows, [(p.latitude, p.longitude) for p in profiles],
+        )).encode()).hexdigest()
+        self.services = np.array([(p.service_type or '').lower() for p in profiles], dtype=object)
+        self.matcher = ProviderMatcher(
+            [p.id for p in profiles],
+            [p.latitude for p in profiles],
+            [p.longitude for p in profiles],
+        )
+
+        # Rows are sorted by cell, so each cell is one contiguous range
+        self.cells = {}
+        for position, profile in enumerate(profiles):
+            start, _ = self.cells.get(profile.grid_cell, (position, position))
+            self.cells[profile.grid_cell] = (start, position + 1)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def patch(self, profiles):
+        """Replace the display fields of these profiles' rows, leaving locations alone.
+
+        Rows are swapped rather than edited, so a request serialising the
+        old row is unaffected; profiles not in the snapshot are skipped.
+        """
+        rows = [snapshot_row(p) for p in profiles if p.id in self.positions]
+        for row in rows:
+            self.rows[self.positions[row['id']]] = self.rows_by_id[row['id']] = row
+        self.digest = hashlib.sha1(repr((self.digest, rows)).encode()).hexdigest()
+
+    def search(self, lat, lon, radius_km, k=None, service=None, after=None):
+        """Return [(row, distance_km), ...] within radius_km, nearest first.
+
+        ``service`` filters on service type (case-insensitive) and ``after``
+        is the (distance_km, id) of the last row of the previous page.
+        """
+        ranges = [self.cells[c] for c in cells_in_box(*bounding_box(lat, lon, radius_km)) if c in self.cells]
+        if not ranges:
+            return []
+        candidates = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        if service:
+            candidates = candidates[self.services[candidates] == service.lower()]
+        matches = self.matcher.nearest(lat, lon, radius_km, k, candidates, after)
+        return [(self.rows_by_id[provider_id], dist) for provider_id, dist in matches]
+
+    def distances(self, lat, lon, ids):
+        """Return {id: distance_km} for those of ``ids`` that are in the snapshot."""
+        ids = [provider_id for provider_id in ids if provider_id in self.positions]
+        if not ids:
+            return {}
+        dist = self.matcher.distances(lat, lon, np.array([self.positions[i] for i in ids]))
+        return dict(zip(ids, dist.tolist()))
+
+
+class ProviderLocationCache:
+    """Per-process cache of the ProviderSnapshot.
+
+    Rebuilt lazily after invalidate(); refresh() only re-reads the rows it names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._patch = 0
+        self._built_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.patches = 0
+        self.invalidations = 0
+
+    def get(self):
+        shared = cache.get_many([VERSION_KEY, PATCHES_KEY])
+        version, patch = shared.get(VERSION_KEY, 0), shared.get(PATCHES_KEY, 0)
+        ttl = getattr(settings, 'PROVIDER_CACHE_TTL', 60)
+        with self._lock:
+            if (self._snapshot is not None and self._version == version
+                    and time.monotonic() - self._built_at < ttl):
+                if patch == self._patch:
+                    self.hits += 1
+                    return self._snapshot
+                if self._apply_patches(patch):
+                    return self._snapshot
+
+            # Rebuild under the lock so concurrent misses share one query
+            self.misses += 1
+            self._snapshot = ProviderSnapshot(self.load())
+            self._version = version
+            self._patch = patch
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+            return self._snapshot
+
+    def _apply_patches(self, patch):
+        # False when the patches can't be trusted: too many, expired, or a
+        # counter that went backwards because the cache was cleared
+        if not 0 < patch - self._patch <= MAX_PATCHES:
+            return False
+        keys = [PATCH_KEY.format(n) for n in range(self._patch + 1, patch + 1)]
+        found = cache.get_many(keys)
+        if len(found) < len(keys):
+            return False
+        user_ids = set().union(*found.values())
+        self._snapshot.patch(self.load().filter(user_id__in=user_ids))
+        self._patch = patch
+        self.patches += 1
+        return True
+
+    def load(self):
+        from .models import UserProfile
+        return UserProfile.objects.filter(
+            is_provider=True, is_verified=True, latitude__isnull=False, longitude__isnull=False,
+        ).select_related('user')
+
+    def invalidate(self):
+        self._bump()
+        # Bump again once the write is committed, in case another request
+        # rebuilt from the pre-commit data in the meantime
+        transaction.on_commit(self._bump)
+
+    def refresh(self, user_ids):
+        """Re-read these providers' names, ratings and photos on every worker.
+
+        For changes that leave the provider's place in the snapshot alone;
+        location, verification and service type changes need invalidate().
+        """
+        user_ids = list(user_ids)
+        self._publish(user_ids)
+        # Again after commit, for workers that re-read the rows before it
+        transaction.on_commit(lambda: self._publish(user_ids))
+
+    def _publish(self, user_ids):
+        try:
+            patch = cache.incr(PATCHES_KEY)
+        except ValueError:
+            cache.add(PATCHES_KEY, 0, None)
+            patch = cache.incr(PATCHES_KEY)
+        # Workers are rebuilt at least every PROVIDER_CACHE_TTL, so older
+        # patches are never needed
+        cache.set(PATCH_KEY.format(patch), user_ids, getattr(settings, 'PROVIDER_CACHE_TTL', 60) + 60)
+
+    def _bump(self):
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, None)
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'patches': self.patches,
+            'invalidations': self.invalidations,
+            'providers': len(self._snapshot) if self._snapshot is not None else None,
+        }
+
+
+provider_cache = ProviderLocationCache()
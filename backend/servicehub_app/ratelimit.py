@@ -0,0 +1,132 @@
+"""Token-bucket rate limits for the write APIs, per user and per client IP.
+
+settings.RATE_LIMITS maps a scope (usually the view name) to a rate such as
+'10/m' for the user and for the IP address: a bucket of 10 tokens that
+refills at one token every 6 seconds. Each bucket is a single cache entry
+holding the time at which it will be full again, so checking both of a
+request's buckets is one get_many() and one set_many() on the
+RATE_LIMIT_CACHE alias, whatever the rates.
+
+The read and the write are separate cache calls. Requests racing on the same
+bucket in a shared cache may both take its last token, which only loosens
+the limit by a request or two.
+"""
+import time
+from functools import lru_cache, wraps
+from math import ceil
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'10/m' -> (10, 60): capacity and the seconds it takes to refill completely."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def buckets(scope, user_id, ip):
+    """[(cache key, (capacity, period)), ...] for the limits that apply to a request."""
+    limits = settings.RATE_LIMITS.get(scope)
+    if not limits:
+        return []
+    found = []
+    if user_id is not None and limits.get('user'):
+        found.append((f'ratelimit:{scope}:u:{user_id}', parse_rate(limits['user'])))
+    if ip and limits.get('ip'):
+        found.append((f'ratelimit:{scope}:ip:{ip}', parse_rate(limits['ip'])))
+    return found
+
+
+def take(stored, limits, now):
+    """Take a token from every bucket, or from none if any is empty.
+
+    ``stored`` maps keys to the times their buckets are full again. Returns
+    the new times to store and the seconds until every bucket has a token
+    (0 when the request is allowed).
+    """
+    updates = {}
+    retry_after = 0
+    for key, (capacity, period) in limits:
+        full_at = max(stored.get(key, now), now) + period / capacity
+        # Empty means it would take longer than a full refill to be full again
+        retry_after = max(retry_after, full_at - now - period)
+        updates[key] = full_at
+    # A little slack for float error in the accumulated refill times
+    return (updates, 0) if retry_after <= 1e-6 else ({}, retry_after)
+
+
+def check(scope, user_id, ip):
+    limits = buckets(scope, user_id, ip)
+    if not limits:
+        return 0
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    now = time.time()
+    updates, retry_after = take(cache.get_many([key for key, _ in limits]), limits, now)
+    if updates:
+        # Entries can expire once their buckets would be full anyway
+        cache.set_many(updates, ceil(max(updates.values()) - now))
+    return retry_after
+
+
+async def acheck(scope, user_id, ip):
+    limits = buckets(scope, user_id, ip)
+    if not limits:
+        return 0
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    now = time.time()
+    updates, retry_after = take(await cache.aget_many([key for key, _ in limits]), limits, now)
+    if updates:
+        await cache.aset_many(updates, ceil(max(updates.values()) - now))
+    return retry_after
+
+
+def client_ip(request):
+    header = settings.RATE_LIMIT_IP_HEADER
+    if header and request.META.get(header):
+        # The last address is the one our own proxy saw; earlier ones can be forged
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def too_many_requests(retry_after):
+    seconds = ceil(retry_after)
+    response = JsonResponse({
+        'status': 'error',
+        'message': f"Too many requests. Please try again in {seconds} seconds.",
+    }, status=429)
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+def rate_limit(scope, methods=('POST',)):
+    """Limit ``methods`` requests to the view by the RATE_LIMITS entry for ``scope``.
+
+    Apply it below login_required, so anonymous requests are turned away
+    before they use up the IP's tokens.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    user = await request.auser()
+                    retry_after = await acheck(scope, user.pk, client_ip(request))
+                    if retry_after:
+                        return too_many_requests(retry_after)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method in methods:
+                    retry_after = check(scope, request.user.pk, client_ip(request))
+                    if retry_after:
+                        return too_many_requests(retry_after)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+"""Full-text provider search over name, service type and bio.
+
+SQLite uses an FTS5 virtual table (servicehub_app_providersearch, rowid =
+profile id) and PostgreSQL a weighted tsvector column on the profile table
+with a GIN index; migration 0020 creates whichever fits the database. Both
+match every search word as a prefix, so "plumb nai" finds a plumber in
+Nairobi. Other databases, or SQLite builds without FTS5, fall back to
+case-insensitive LIKE matching, which scans the table and returns matches
+unranked.
+
+The index covers every provider and is updated from signals on profile and
+user saves; bulk loaders call index_profiles() themselves, and the
+rebuild_search_index command rebuilds the whole index.
+"""
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'servicehub_app_providersearch'
+# Weights for name, service type and bio
+FTS_WEIGHTS = (10.0, 10.0, 2.0)
+
+
+def search_words(query):
+    return re.findall(r'\w+', query.lower())
+
+
+@lru_cache(maxsize=None)
+def backend():
+    """'fts5', 'tsvector' or 'fallback' for the default database."""
+    if connection.vendor == 'postgresql':
+        return 'tsvector'
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        return 'fts5'
+    return 'fallback'
+
+
+def index_profiles(profile_ids):
+    """Bring the index entries of these profiles up to date (non-providers are dropped)."""
+    _reindex('id', profile_ids)
+
+
+def index_users(user_ids):
+    # The indexed name lives on the User row
+    _reindex('user_id', user_ids)
+
+
+def _reindex(column, ids):
+    ids = list(ids)
+    if backend() == 'fallback':
+        return
+    # Chunked to stay well under SQLite's bound parameter limit
+    for start in range(0, len(ids), 500):
+        _reindex_chunk(column, ids[start:start + 500])
+
+
+def _reindex_chunk(column, ids):
+    with connection.cursor() as cursor:
+        if backend() == 'fts5':
+            placeholders = ','.join(['%s'] * len(ids))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+                f"(SELECT id FROM servicehub_app_userprofile WHERE {column} IN ({placeholders}))",
+                ids,
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, service_type, bio) "
+                f"SELECT p.id, u.first_name || ' ' || u.last_name || ' ' || u.username, "
+                f"COALESCE(p.service_type, ''), COALESCE(p.bio, '') "
+                f"FROM servicehub_app_userprofile p JOIN auth_user u ON u.id = p.user_id "
+                f"WHERE p.is_provider AND p.{column} IN ({placeholders})",
+                ids,
+            )
+        else:
+            cursor.execute(
+                f"UPDATE servicehub_app_userprofile p SET search_vector = CASE WHEN p.is_provider THEN "
+                f"setweight(to_tsvector('simple', u.first_name || ' ' || u.last_name || ' ' || u.username), 'A') || "
+                f"setweight(to_tsvector('simple', COALESCE(p.service_type, '')), 'A') || "
+                f"setweight(to_tsvector('simple', COALESCE(p.bio, '')), 'B') END "
+                f"FROM auth_user u WHERE u.id = p.user_id AND p.{column} = ANY(%s)",
+                [ids],
+            )
+
+
+def remove_profile(profile_id):
+    # The PostgreSQL column goes with the row itself
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [profile_id])
+
+
+def rebuild_index():
+    from .models import UserProfile
+
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    ids = list(UserProfile.objects.filter(is_provider=True).values_list('pk', flat=True))
+    index_profiles(ids)
+    return len(ids)
+
+
+def search(query, limit=None, verified_only=True):
+    """Return [(profile_id, relevance), ...] for matching providers, best first.
+
+    Relevance is positive and only comparable within one search; the
+    fallback gives every match the same relevance.
+    """
+    words = search_words(query)
+    if not words:
+        return []
+    verified = ' AND p.is_verified' if verified_only else ''
+    limit_sql = ' LIMIT %s' if limit is not None else ''
+    limit_params = [limit] if limit is not None else []
+
+    if backend() == 'fts5':
+        # Each word quoted (so it can't be read as FTS syntax) and prefix-matched
+        match = ' '.join(f'"{word}"*' for word in words)
+        rank = f"bm25({FTS_TABLE}, {', '.join(map(str, FTS_WEIGHTS))})"
+        sql = (
+            f"SELECT p.id, -{rank} FROM {FTS_TABLE} "
+            f"JOIN servicehub_app_userprofile p ON p.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND p.is_provider{verified} ORDER BY {rank}, p.id{limit_sql}"
+        )
+        params = [match] + limit_params
+    elif backend() == 'tsvector':
+        sql = (
+            f"SELECT p.id, ts_rank(p.search_vector, q) FROM servicehub_app_userprofile p, "
+            f"to_tsquery('simple', %s) q WHERE p.search_vector @@ q AND p.is_provider{verified} "
+            f"ORDER BY 2 DESC, p.id{limit_sql}"
+        )
+        params = [' & '.join(f'{word}:*' for word in words)] + limit_params
+    else:
+        return fallback_search(words, limit, verified_only)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(profile_id, float(rank)) for profile_id, rank in cursor.fetchall()]
+
+
+def fallback_search(words, limit, verified_only):
+    from .models import UserProfile
+
+    profiles = UserProfile.objects.filter(is_provider=True)
+    if verified_only:
+        profiles = profiles.filter(is_verified=True)
+    for word in words:
+        profiles = profiles.filter(
+            Q(user__first_name__icontains=word) | Q(user__last_name__icontains=word)
+            | Q(user__username__icontains=word) | Q(service_type__icontains=word) | Q(bio__icontains=word)
+        )
+    ids = profiles.order_by('-rating_avg', 'pk').values_list('pk', flat=True)
+    return [(profile_id, 1.0) for profile_id in (ids[:limit] if limit is not None else ids)]
@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import search
+from .models import AVAILABILITY_FIELDS, UserProfile, Provider, Client, Booking, ProviderLedger, Rating, ServiceAvailability
+from .provider_cache import provider_cache
+
+# Profile and user fields that feed the provider search index
+PROFILE_SEARCH_FIELDS = {'is_provider', 'service_type', 'bio', 'user'}
+USER_SEARCH_FIELDS = {'first_name', 'last_name', 'username'}
+
+
+# Profile edits, applications and deletions change what nearby search returns.
+# Queryset update() calls skip these signals and must invalidate explicitly.
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Provider)
+@receiver(post_save, sender=Client)
+def refresh_on_profile_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # Client profiles never reach the snapshot, unless they were a provider until this save
+    stored = {} if created else getattr(instance, '_stored_availability', None)
+    if not (instance.is_provider or stored is None or stored.get('is_provider')):
+        return
+    if update_fields is not None and set(AVAILABILITY_FIELDS).isdisjoint(update_fields):
+        moved = False
+    else:
+        # Location, verification and service type decide where the row sits
+        moved = stored is None or any(stored.get(field) != getattr(instance, field) for field in AVAILABILITY_FIELDS)
+    if moved:
+        provider_cache.invalidate()
+    else:
+        # e.g. a new phone number or the thumbnails job: just this row
+        provider_cache.refresh([instance.user_id])
+
+
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Provider)
+@receiver(post_delete, sender=Client)
+def invalidate_on_profile_delete(sender, instance, **kwargs):
+    if instance.is_provider:
+        provider_cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+def refresh_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # The snapshot shows the provider's name and nothing else from User; new
+    # users have no profile yet
+    if created or (update_fields is not None and not USER_SEARCH_FIELDS & set(update_fields)):
+        return
+    if UserProfile.objects.filter(user_id=instance.pk, is_provider=True).exists():
+        provider_cache.refresh([instance.pk])
+
+
+# The search index is written in the same transaction as the profile. Bulk
+# loaders bypass these and call search.index_profiles() themselves.
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Provider)
+@receiver(post_save, sender=Client)
+def index_profile(sender, instance, created=False, update_fields=None, **kwargs):
+    if created and not instance.is_provider:
+        return
+    if update_fields is not None and not PROFILE_SEARCH_FIELDS & set(update_fields):
+        return
+    search.index_profiles([instance.pk])
+
+
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Provider)
+@receiver(post_delete, sender=Client)
+def unindex_profile(sender, instance, **kwargs):
+    search.remove_profile(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def index_user_name(sender, instance, created=False, update_fields=None, **kwargs):
+    # New users have no profile yet
+    if created or (update_fields is not None and not USER_SEARCH_FIELDS & set(update_fields)):
+        return
+    search.index_users([instance.pk])
+
+
+# Deleted directly or through their user; update() and bulk deletes that skip
+# signals need rebuild_service_availability
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Provider)
+@receiver(post_delete, sender=Client)
+def uncount_profile(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_availability', instance.__dict__)
+    ServiceAvailability.record(UserProfile.availability_key(stored), -1)
+
+
+# A signal rather than Rating.delete(), so cascades from a deleted user and
+# queryset deletes (admin bulk delete, seed_data --clear) are counted out too
+@receiver(post_delete, sender=Rating)
+def uncount_rating(sender, instance, **kwargs):
+    stars = getattr(instance, '_stored_stars', instance.stars)
+    UserProfile.apply_rating_change(instance.provider_id, -stars, -1)
+
+
+# Same for bookings and the provider's ledger
+@receiver(post_delete, sender=Booking)
+def unrecord_booking(sender, instance, **kwargs):
+    provider_id, earned, paid = getattr(instance, '_stored_earnings', instance.ledger_contribution())
+    # No row to create: the provider's ledger may be going in the same cascade
+    ProviderLedger.record(provider_id, -earned, -paid, create=False)
@@ -1,3 +1,1242 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+
+from .commission import split_amount
+from .events import EventBackend, get_backend
+from .geo import ProviderMatcher, calculate_distance, grid_cell
+from .instrumentation import metrics
+from .jobs import claim_next, requeue_stale, run_pending
+from .models import UserProfile, Rating, Booking, BookingTransition, ProviderLedger, PayoutBatch, Job
+from .payouts import _pay_chunk, process_batch, start_batch
+from .provider_cache import ProviderLocationCache, provider_cache
+from .ratelimit import take
+from .thumbnails import generate_thumbnails
+from . import search
+
+NAIROBI = (-1.286389, 36.817223)
+
+
+def make_provider(username, lat, lon, verified=True, service='Plumber'):
+    user = User.objects.create_user(username=username, password='pass12345')
+    return UserProfile.objects.create(
+        user=user, is_provider=True, is_verified=verified, service_type=service,
+        latitude=lat, longitude=lon,
+    )
+
+
+class NearbyProvidersTests(TestCase):
+    def setUp(self):
+        provider_cache.invalidate()
+
+    def test_grid_cell_follows_coordinates(self):
+        profile = make_provider('mover', -1.28, 36.81)
+        self.assertEqual(profile.grid_cell, grid_cell(-1.28, 36.81))
+
+        profile.latitude, profile.longitude = 0.5, 35.2
+        profile.save(update_fields=['latitude', 'longitude'])
+        profile.refresh_from_db()
+        self.assertEqual(profile.grid_cell, grid_cell(0.5, 35.2))
+
+    def test_only_providers_within_radius_are_returned(self):
+        make_provider('near', -1.29, 36.82)
+        make_provider('edge_of_cell', -1.30, 36.80)
+        make_provider('far', -1.40, 36.90)
+        make_provider('unverified', -1.29, 36.82, verified=False)
+
+        response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        names = sorted(p['name'] for p in response.json()['providers'])
+        self.assertEqual(names, ['edge_of_cell', 'near'])
+
+    def test_filters_sorting_and_pagination(self):
+        near = make_provider('near', -1.2870, 36.8175)
+        mid = make_provider('mid', -1.2900, 36.8200, service='Electrical')
+        far = make_provider('far', -1.3000, 36.8300)
+        remote = make_provider('remote', -1.3300, 36.8500)
+
+        search = {'lat': NAIROBI[0], 'lon': NAIROBI[1]}
+        ids = [p['id'] for p in self.client.get('/api/nearby-providers/', search).json()['providers']]
+        self.assertEqual(ids, [near.id, mid.id, far.id])
+
+        response = self.client.get('/api/nearby-providers/', dict(search, service='plumber', radius=10))
+        self.assertEqual([p['id'] for p in response.json()['providers']], [near.id, far.id, remote.id])
+
+        pages, cursor = [], None
+        while True:
+            params = dict(search, radius=10, limit=1, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get('/api/nearby-providers/', params).json()
+            pages.append([p['id'] for p in data['providers']])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, [[near.id], [mid.id], [far.id], [remote.id]])
+
+    def test_invalid_coordinates(self):
+        for lat, lon in (('abc', '1'), ('nan', '1'), ('1', 'inf'), ('-inf', '1'), ('91', '1'), ('1', '-180.5')):
+            response = self.client.get('/api/nearby-providers/', {'lat': lat, 'lon': lon})
+            self.assertEqual(response.status_code, 400, (lat, lon))
+        for bad in ({'radius': '500'}, {'limit': '0'}, {'cursor': 'nope'}):
+            response = self.client.get('/api/nearby-providers/', dict(lat=NAIROBI[0], lon=NAIROBI[1], **bad))
+            self.assertEqual(response.status_code, 400)
+
+    def test_query_count_is_constant(self):
+        client = User.objects.create_user(username='rater', password='pass12345')
+        for count in (1, 5):
+            for i in range(count):
+                profile = make_provider(f'p{count}_{i}', -1.29, 36.82)
+                Rating.objects.create(provider=profile.user, client=client, stars=4)
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+            self.assertTrue(all(p['rating'] == 4 and p['review_count'] == 1
+                                for p in response.json()['providers']))
+
+    def test_conditional_get(self):
+        make_provider('near', -1.29, 36.82)
+        response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        etag = response['ETag']
+        self.assertIn('max-age=30', response['Cache-Control'])
+
+        # A few metres away rounds to the same search
+        response = self.client.get('/api/nearby-providers/', {'lat': -1.28641, 'lon': 36.81719},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        make_provider('newcomer', -1.29, 36.82)
+        response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['providers']), 2)
+
+
+class ProviderCacheTests(TestCase):
+    def setUp(self):
+        provider_cache.invalidate()
+        self.search = {'lat': NAIROBI[0], 'lon': NAIROBI[1]}
+
+    def test_repeat_searches_are_served_from_cache(self):
+        make_provider('cached', -1.29, 36.82)
+        self.client.get('/api/nearby-providers/', self.search)
+        before = provider_cache.stats()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/nearby-providers/', self.search)
+        self.assertEqual(len(response.json()['providers']), 1)
+        self.assertEqual(provider_cache.stats()['hits'], before['hits'] + 1)
+
+    def test_admin_verification_invalidates(self):
+        pending = make_provider('pending', -1.29, 36.82, verified=False)
+        self.assertEqual(self.client.get('/api/nearby-providers/', self.search).json()['providers'], [])
+
+        admin = User.objects.create_superuser(username='boss', password='pass12345')
+        self.client.force_login(admin)
+        self.client.post('/admin/servicehub_app/provider/', {
+            'action': 'make_verified', '_selected_action': [pending.pk],
+        })
+        providers = self.client.get('/api/nearby-providers/', self.search).json()['providers']
+        self.assertEqual([p['id'] for p in providers], [pending.pk])
+
+    def test_rating_refreshes_only_its_row(self):
+        profile = make_provider('rated', -1.29, 36.82)
+        make_provider('other', -1.29, 36.82)
+        first = self.client.get('/api/nearby-providers/', self.search)
+        # Another worker process, sharing the cache backend
+        other_worker = ProviderLocationCache()
+        other_worker.get()
+        before = provider_cache.stats()
+
+        rater = User.objects.create_user(username='rater', password='pass12345')
+        Rating.objects.create(provider=profile.user, client=rater, stars=3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/nearby-providers/', self.search, HTTP_IF_NONE_MATCH=first['ETag'])
+        rated = next(p for p in response.json()['providers'] if p['id'] == profile.id)
+        self.assertEqual((rated['rating'], rated['review_count']), (3, 1))
+        stats = provider_cache.stats()
+        self.assertEqual((stats['rebuilds'], stats['patches']), (before['rebuilds'], before['patches'] + 1))
+
+        row = other_worker.get().rows_by_id[profile.id]
+        self.assertEqual((row['rating'], row['review_count'], other_worker.rebuilds), (3, 1, 1))
+
+    def test_moving_a_provider_rebuilds(self):
+        profile = make_provider('mover', -1.29, 36.82)
+        self.client.get('/api/nearby-providers/', self.search)
+        rebuilds = provider_cache.stats()['rebuilds']
+        profile.latitude, profile.longitude = 0.5, 30.0
+        profile.save()
+        self.assertEqual(self.client.get('/api/nearby-providers/', self.search).json()['providers'], [])
+        self.assertEqual(provider_cache.stats()['rebuilds'], rebuilds + 1)
+
+    def test_client_changes_keep_the_snapshot(self):
+        profile = make_provider('fundi', -1.29, 36.82)
+        before = provider_cache.stats()['invalidations']
+        user = User.objects.create_user(username='client', password='pass12345')
+        client = UserProfile.objects.create(user=user, phone_number='0700')
+        client.phone_number = '0711'
+        client.save()
+        user.first_name = 'Wanjiru'
+        user.save()
+        self.assertEqual(provider_cache.stats()['invalidations'], before)
+
+        # A provider's name is shown, so renaming one refreshes their row
+        self.client.get('/api/nearby-providers/', self.search)
+        profile.user.first_name = 'Otieno'
+        profile.user.save()
+        provider = self.client.get('/api/nearby-providers/', self.search).json()['providers'][0]
+        self.assertEqual(provider['name'], 'Otieno')
+        self.assertEqual(provider_cache.stats()['invalidations'], before)
+
+    def test_client_becoming_provider_and_back_invalidates(self):
+        user = User.objects.create_user(username='client', password='pass12345')
+        UserProfile.objects.create(user=user, latitude=-1.29, longitude=36.82)
+        profile = UserProfile.objects.get(user=user)
+        profile.is_provider = profile.is_verified = True
+        profile.save()
+        self.assertEqual(len(self.client.get('/api/nearby-providers/', self.search).json()['providers']), 1)
+
+        profile = UserProfile.objects.get(user=user)
+        profile.is_provider = False
+        profile.save()
+        self.assertEqual(self.client.get('/api/nearby-providers/', self.search).json()['providers'], [])
+
+
+class ProviderMatcherTests(SimpleTestCase):
+    def test_matches_scalar_reference(self):
+        rng = random.Random(7)
+        lats = [NAIROBI[0] + rng.uniform(-0.1, 0.1) for _ in range(2000)]
+        lons = [NAIROBI[1] + rng.uniform(-0.1, 0.1) for _ in range(2000)]
+        matcher = ProviderMatcher(range(2000), lats, lons)
+
+        expected = sorted(
+            (calculate_distance(*NAIROBI, lat, lon), i) for i, (lat, lon) in enumerate(zip(lats, lons))
+        )
+        within = [(i, d) for d, i in expected if d <= 3.0]
+        result = matcher.nearest(*NAIROBI, 3.0)
+        self.assertEqual([i for i, _ in result], [i for i, _ in within])
+        for (_, got), (_, want) in zip(result, within):
+            self.assertAlmostEqual(got, want, places=9)
+
+        self.assertEqual(matcher.nearest(*NAIROBI, 3.0, k=5), result[:5])
+        self.assertEqual(matcher.nearest(*NAIROBI, 3.0, k=0), [])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.profile = make_provider('fundi', -1.29, 36.82)
+        self.rater = User.objects.create_user(username='rater', password='pass12345')
+        self.client.force_login(self.rater)
+
+    def rate(self, stars):
+        return self.client.post('/api/submit-rating/', {'provider_username': 'fundi', 'stars': stars},
+                                content_type='application/json')
+
+    def test_create_then_edit_rating(self):
+        self.rate(4)
+        other = User.objects.create_user(username='other', password='pass12345')
+        Rating.objects.create(provider=self.profile.user, client=other, stars=1)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count), (5, 2))
+        self.assertEqual(self.profile.get_rating(), 2.5)
+
+        # Editing an existing rating changes the sum but not the count
+        self.rate(2)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count), (3, 2))
+        self.assertEqual(self.profile.get_rating(), 1.5)
+
+        Rating.objects.get(client=other).delete()
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count), (2, 1))
+
+    def test_deleting_the_client_removes_their_rating(self):
+        self.rate(5)
+        self.rater.delete()
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count, self.profile.rating_avg), (0, 0, 0.0))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.rate(5)
+        UserProfile.objects.filter(pk=self.profile.pk).update(rating_sum=40, rating_count=9)
+
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn('fundi: stored 40/9, actual 5/1', out.getvalue())
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_sum, self.profile.rating_count, self.profile.rating_avg), (5, 1, 5.0))
+
+
+class ProviderDashboardTests(TestCase):
+    def setUp(self):
+        self.provider = make_provider('fundi', -1.29, 36.82).user
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.client.force_login(self.provider)
+
+    def add_jobs(self, count, **fields):
+        for _ in range(count):
+            Booking.objects.create(client=self.customer, provider=self.provider, description='job', **fields)
+
+    def test_totals_and_pagination(self):
+        self.add_jobs(30, total_amount=100, status=Booking.Status.COMPLETED, is_paid_to_provider=True)
+        self.add_jobs(4, total_amount=200, status=Booking.Status.COMPLETED)
+        self.add_jobs(2, status=Booking.Status.PENDING)
+
+        response = self.client.get('/dashboard/')
+        context = response.context
+        self.assertEqual(context['total_earned'], 30 * 90 + 4 * 180)
+        self.assertEqual(context['already_paid'], 30 * 90)
+        self.assertEqual(context['pending_payout'], 4 * 180)
+        self.assertEqual(len(context['active_jobs']), 6)
+        self.assertEqual(len(context['payout_history']), 25)
+
+        response = self.client.get('/dashboard/', {'payout_page': 2})
+        self.assertEqual(len(response.context['payout_history']), 5)
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.add_jobs(3, total_amount=100, status=Booking.Status.COMPLETED, is_paid_to_provider=True)
+        self.add_jobs(1, status=Booking.Status.PENDING)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/dashboard/')
+        self.add_jobs(200, total_amount=100, status=Booking.Status.COMPLETED, is_paid_to_provider=True)
+        self.add_jobs(200, status=Booking.Status.PENDING)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/dashboard/')
+        self.assertEqual(len(small), len(large))
+
+
+class ProviderLedgerTests(TestCase):
+    def setUp(self):
+        self.provider = make_provider('fundi', -1.29, 36.82).user
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.booking = Booking.objects.create(client=self.customer, provider=self.provider, description='leak')
+        self.client.force_login(self.provider)
+
+    def ledger(self):
+        ledger = ProviderLedger.objects.get(provider=self.provider)
+        return ledger.total_earned, ledger.total_paid
+
+    def post(self, url, data=None):
+        return self.client.post(url, data or {}, content_type='application/json')
+
+    def accept(self):
+        Booking.objects.get(pk=self.booking.pk).transition('accept', actor=self.customer)
+
+    def test_booking_lifecycle_updates_ledger(self):
+        self.post(f'/api/send-quote/{self.booking.id}/', {'price': '1000'})
+        self.assertFalse(ProviderLedger.objects.exists())
+
+        # Revising the quote is fine until the client accepts it
+        self.post(f'/api/send-quote/{self.booking.id}/', {'price': '1200'})
+        self.assertEqual(self.post(f'/api/complete-job/{self.booking.id}/').status_code, 409)
+        self.accept()
+        self.post(f'/api/complete-job/{self.booking.id}/')
+        self.assertEqual(self.ledger(), (Decimal('1080.00'), 0))
+
+        # A completed job can't be re-quoted
+        self.assertEqual(self.post(f'/api/send-quote/{self.booking.id}/', {'price': '5'}).status_code, 409)
+        self.assertEqual(self.ledger(), (Decimal('1080.00'), 0))
+
+        # Writes that bypass save() are caught and fixed by reconciliation
+        Booking.objects.filter(pk=self.booking.pk).update(status=Booking.Status.QUOTED)
+        call_command('reconcile_ledger', '--repair', stdout=StringIO())
+        self.assertEqual(self.ledger(), (0, 0))
+
+    def test_admin_payout_and_reconcile(self):
+        self.post(f'/api/send-quote/{self.booking.id}/', {'price': '1000'})
+        self.accept()
+        self.post(f'/api/complete-job/{self.booking.id}/')
+
+        admin = User.objects.create_superuser(username='boss', password='pass12345')
+        self.client.force_login(admin)
+        for _ in range(2):
+            self.client.post('/admin/servicehub_app/booking/', {
+                'action': 'mark_as_paid', '_selected_action': [self.booking.pk],
+            })
+        self.assertEqual(self.ledger(), (Decimal('900.00'), Decimal('900.00')))
+
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('match', out.getvalue())
+
+        # The change form can't mark a booking paid behind the payout's back
+        response = self.client.get(f'/admin/servicehub_app/booking/{self.booking.pk}/change/')
+        self.assertNotIn('is_paid_to_provider', response.context['adminform'].form.fields)
+        self.assertNotIn('payout_date', response.context['adminform'].form.fields)
+
+        ProviderLedger.objects.update(total_paid=5)
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('out of step', out.getvalue())
+
+    def test_deleting_the_client_removes_their_earnings(self):
+        for _ in range(2):
+            Booking.objects.create(client=self.customer, provider=self.provider, description='tap',
+                                   total_amount=100, status=Booking.Status.COMPLETED)
+        other = User.objects.create_user(username='other', password='pass12345')
+        Booking.objects.create(client=other, provider=self.provider, description='sink',
+                               total_amount=100, status=Booking.Status.PAID, is_paid_to_provider=True)
+        self.assertEqual(self.ledger(), (Decimal('270.00'), Decimal('90.00')))
+
+        self.customer.delete()
+        self.assertEqual(self.ledger(), (Decimal('90.00'), Decimal('90.00')))
+
+        # The provider's own ledger goes with them rather than being recreated
+        self.provider.delete()
+        self.assertFalse(ProviderLedger.objects.exists())
+
+
+class CommissionTests(SimpleTestCase):
+    def reference_split(self, cents, rate_basis_points):
+        # Integer-cent reference: fee rounded half-up, provider gets the rest
+        fee = (cents * rate_basis_points + 5000) // 10000
+        return cents - fee, fee
+
+    def test_matches_integer_reference(self):
+        rng = random.Random(11)
+        amounts = [0, 1, 4, 5, 5, 15, 25, 99999999] + [rng.randrange(0, 10 ** 10) for _ in range(1_000_000)]
+        for cents in amounts:
+            cut, fee = split_amount(Decimal(cents).scaleb(-2))
+            expected_cut, expected_fee = self.reference_split(cents, 1000)
+            if (cut * 100, fee * 100) != (expected_cut, expected_fee):
+                self.fail(f'{cents / 100}: got {cut}/{fee}, expected {expected_cut / 100}/{expected_fee / 100}')
+
+    def test_accepts_float_and_string_input(self):
+        self.assertEqual(split_amount(0.1 + 0.2), (Decimal('0.27'), Decimal('0.03')))
+        self.assertEqual(split_amount('1234.55'), (Decimal('1111.09'), Decimal('123.46')))
+
+    @override_settings(PLATFORM_COMMISSION_RATES={'default': '0.10', 'Plumber': '0.125'})
+    def test_per_service_rates(self):
+        self.assertEqual(split_amount('1000', 'Plumber'), (Decimal('875.00'), Decimal('125.00')))
+        self.assertEqual(split_amount('1000', 'Tailor'), (Decimal('900.00'), Decimal('100.00')))
+
+
+class CommissionRepricingTests(TestCase):
+    def test_bulk_recompute_updates_bookings_and_ledger(self):
+        provider = make_provider('fundi', -1.29, 36.82).user
+        customer = User.objects.create_user(username='customer', password='pass12345')
+        for amount in ('1000', '333.33'):
+            Booking.objects.create(client=customer, provider=provider, description='job',
+                                   total_amount=amount, status=Booking.Status.COMPLETED)
+        paid = Booking.objects.create(client=customer, provider=provider, description='job', total_amount='100',
+                                      status=Booking.Status.PAID, is_paid_to_provider=True)
+        ledger = ProviderLedger.objects.get(provider=provider)
+        self.assertEqual((ledger.total_earned, ledger.total_paid), (Decimal('1290.00'), Decimal('90.00')))
+
+        with override_settings(PLATFORM_COMMISSION_RATES={'default': '0.10', 'Plumber': '0.20'}):
+            out = StringIO()
+            call_command('recompute_commissions', '--batch-size', '1', stdout=out)
+            self.assertIn('Checked 2 bookings, updated 2', out.getvalue())
+            self.assertEqual(sorted(Booking.objects.exclude(pk=paid.pk).values_list('provider_cut', 'platform_fee')),
+                             [(Decimal('266.66'), Decimal('66.67')), (Decimal('800.00'), Decimal('200.00'))])
+            # Bookings already paid out keep the split their payout used
+            ledger.refresh_from_db()
+            self.assertEqual((ledger.total_earned, ledger.total_paid), (Decimal('1156.66'), Decimal('90.00')))
+
+            out = StringIO()
+            call_command('recompute_commissions', '--include-paid', stdout=out)
+            self.assertIn('Checked 3 bookings, updated 1', out.getvalue())
+            ledger.refresh_from_db()
+            self.assertEqual((ledger.total_earned, ledger.total_paid), (Decimal('1146.66'), Decimal('80.00')))
+
+
+class PayoutTests(TestCase):
+    def setUp(self):
+        customer = User.objects.create_user(username='customer', password='pass12345')
+        self.providers = [make_provider(name, -1.29, 36.82).user for name in ('fundi', 'fundi2')]
+        for i in range(10):
+            Booking.objects.create(client=customer, provider=self.providers[i % 2], description='job',
+                                   total_amount=100, status=Booking.Status.COMPLETED)
+        Booking.objects.create(client=customer, provider=self.providers[0], description='job', status=Booking.Status.PENDING)
+
+    def test_command_pays_every_completed_booking(self):
+        out = StringIO()
+        call_command('run_payouts', '--chunk-size', '3', stdout=out)
+        self.assertIn('paid 10 bookings', out.getvalue())
+
+        batch = PayoutBatch.objects.get()
+        self.assertEqual((batch.status, batch.booking_count, batch.total_amount), ('completed', 10, Decimal('900.00')))
+        self.assertEqual(sorted(batch.payouts.values_list('booking_count', 'amount')),
+                         [(5, Decimal('450.00')), (5, Decimal('450.00'))])
+        self.assertEqual(Booking.objects.filter(is_paid_to_provider=True, payout_batch=batch).count(), 10)
+        self.assertEqual(ProviderLedger.objects.get(provider=self.providers[0]).total_paid, Decimal('450.00'))
+
+        call_command('run_payouts', stdout=out)
+        self.assertEqual(PayoutBatch.objects.count(), 1)
+
+    def test_interrupted_batch_resumes_without_double_paying(self):
+        class Crash(Exception):
+            pass
+
+        def crash_after_first_payment(stats):
+            if stats['paid']:
+                raise Crash
+
+        batch = start_batch()
+        with self.assertRaises(Crash):
+            process_batch(batch, chunk_size=4, progress=crash_after_first_payment)
+        self.assertEqual(Booking.objects.filter(is_paid_to_provider=True).count(), 4)
+
+        call_command('run_payouts', '--resume-only', stdout=StringIO())
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.booking_count), ('completed', 10))
+        self.assertEqual(sum(ProviderLedger.objects.values_list('total_paid', flat=True)), Decimal('900.00'))
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('match', out.getvalue())
+
+    def test_chunk_only_logs_bookings_it_paid(self):
+        batch = start_batch()
+        completed, changed = Booking.objects.filter(status=Booking.Status.COMPLETED).order_by('pk')[:2]
+        Booking.objects.filter(pk__in=[completed.pk, changed.pk]).update(payout_batch=batch)
+        # Moved away from completed after being claimed, e.g. by a concurrent edit
+        Booking.objects.filter(pk=changed.pk).update(status=Booking.Status.ACCEPTED)
+        with transaction.atomic():
+            self.assertEqual(_pay_chunk(batch, [completed.pk, changed.pk]), (1, Decimal('90.00')))
+        self.assertEqual(list(BookingTransition.objects.values_list('booking_id', flat=True)), [completed.pk])
+
+
+class MyBookingsTests(TestCase):
+    def setUp(self):
+        self.provider = make_provider('fundi', -1.29, 36.82).user
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.client.force_login(self.customer)
+        Booking.objects.bulk_create([
+            Booking(client=self.customer, provider=self.provider, description=f'job {i}', total_amount=100)
+            for i in range(7)
+        ])
+
+    def test_cursor_pagination(self):
+        seen, cursor = [], None
+        with self.assertNumQueries(4):
+            # user, version marker, first page and the summary aggregate; the
+            # session comes from the cache
+            data = self.client.get('/api/my-bookings/', {'limit': 3}).json()
+        self.assertEqual(data['summary']['count'], 7)
+        self.assertEqual(data['bookings'][0]['provider'], 'fundi')
+        while True:
+            seen.extend(b['id'] for b in data['bookings'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+            data = self.client.get('/api/my-bookings/', {'limit': 3, 'cursor': cursor}).json()
+            self.assertNotIn('summary', data)
+        expected = list(Booking.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    @override_settings(PLATFORM_COMMISSION_RATES={'default': '0.15'})
+    def test_summary_uses_the_booking_splits(self):
+        Booking.objects.create(client=self.customer, provider=self.provider, description='tap', total_amount=200)
+        summary = self.client.get('/api/my-bookings/').json()['summary']
+        # The bulk-created bookings were never split
+        self.assertEqual((Decimal(summary['total_spent']), Decimal(summary['total_to_providers'])),
+                         (Decimal('900'), Decimal('170')))
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/my-bookings/', {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['provider'], 'fundi')
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/my-bookings/', {'cursor': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/my-bookings/')
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        # Removing a booking needn't move the newest updated_at, so no Last-Modified
+        self.assertNotIn('Last-Modified', response)
+
+        with self.assertNumQueries(2):
+            # user and version marker only
+            response = self.client.get('/api/my-bookings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Without the ETag the unchanged page comes from the cache
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/my-bookings/')['ETag'], etag)
+
+        booking = Booking.objects.filter(client=self.customer).first()
+        booking.transition('quote', total_amount=100)
+        response = self.client.get('/api/my-bookings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        booking.delete()
+        self.assertEqual(self.client.get('/api/my-bookings/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get('/api/my-bookings/', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncViewTests(TestCase):
+    """The JSON API under an ASGI request, through the async ORM paths."""
+
+    def setUp(self):
+        provider_cache.invalidate()
+        self.profile = make_provider('fundi', -1.29, 36.82)
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.client = AsyncClient()
+
+    async def test_booking_round_trip(self):
+        await self.client.aforce_login(self.customer)
+        response = await self.client.post(f'/api/book/{self.profile.id}/', {'description': 'leak'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        data = (await self.client.get('/api/my-bookings/')).json()
+        self.assertEqual([b['provider'] for b in data['bookings']], ['fundi'])
+        self.assertEqual(data['summary']['count'], 1)
+
+        response = await self.client.get('/api/my-bookings/', {'format': 'ndjson'})
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(json.loads(lines[0])['provider'], 'fundi')
+
+    async def test_nearby(self):
+        response = await self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        self.assertEqual([p['id'] for p in response.json()['providers']], [self.profile.id])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        provider_cache.invalidate()
+        metrics.reset()
+        self.provider = make_provider('fundi', -1.29, 36.82)
+        self.staff = User.objects.create_user(username='ops', password='pass12345', is_staff=True)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries"$')
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.staff)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('servicehub_request_queries_bucket{view="nearby_providers",method="GET",le="1"} 1', body)
+        self.assertIn('servicehub_request_duration_seconds_count{view="nearby_providers",method="GET"} 1', body)
+        self.assertIn('servicehub_responses_total{view="nearby_providers",method="GET",status="200"} 1', body)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_metrics_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    async def test_async_views_count_their_queries(self):
+        client = AsyncClient()
+        await client.aforce_login(self.staff)
+        response = await client.get('/api/my-bookings/')
+        # The ORM calls run in asgiref's worker thread but are still counted
+        self.assertIn('desc="', response['Server-Timing'])
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_TOP_SQL=1)
+    def test_slow_request_log(self):
+        self.client.force_login(self.provider.user)
+        with self.assertLogs('servicehub.slow_requests', 'WARNING') as logs:
+            self.client.get('/dashboard/')
+        message = logs.output[0]
+        self.assertIn('Slow request GET /dashboard/ (provider_dashboard)', message)
+        self.assertEqual(message.count('ms  SELECT'), 1)
+
+
+class PageCacheTests(TestCase):
+    def test_contact_page_is_cached_per_session(self):
+        user = User.objects.create_user(username='customer', password='pass12345')
+        self.client.force_login(user)
+        # The first visit also sets the CSRF cookie, which changes the cache key
+        self.client.get('/contact/')
+        first = self.client.get('/contact/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/contact/')
+        self.assertEqual(first.content, second.content)
+        self.assertIn('Cookie', second['Vary'])
+
+        other = User.objects.create_user(username='someone_else', password='pass12345')
+        self.client.force_login(other)
+        self.assertContains(self.client.get('/contact/'), 'someone_else')
+
+
+class ImportExportTests(TestCase):
+    def write(self, name, content):
+        path = f"{tempfile.mkdtemp()}/{name}"
+        self.addCleanup(shutil.rmtree, path.rsplit('/', 1)[0])
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_providers_csv(self):
+        provider_cache.invalidate()
+        make_provider('existing', -1.29, 36.82)
+        path = self.write('providers.csv', (
+            "username,password,first_name,service_type,latitude,longitude,is_verified\n"
+            "wanjiku,s3cret-pass,Wanjiku,Plumber,-1.2901,36.8201,true\n"
+            "existing,s3cret-pass,Dup,Plumber,-1.29,36.82,true\n"
+            "otieno,s3cret-pass,Otieno,Electrician,-1.30,36.83,no\n"
+        ))
+        out = StringIO()
+        call_command('import_users', path, role='provider', workers=2, stdout=out)
+        self.assertIn('Imported 2 providers, skipped 1', out.getvalue())
+
+        wanjiku = UserProfile.objects.select_related('user').get(user__username='wanjiku')
+        self.assertTrue(wanjiku.user.check_password('s3cret-pass'))
+        self.assertEqual(wanjiku.grid_cell, grid_cell(-1.2901, 36.8201))
+        self.assertFalse(UserProfile.objects.get(user__username='otieno').is_verified)
+
+        response = self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        self.assertIn('Wanjiku', [p['name'] for p in response.json()['providers']])
+        # bulk_create skips the signals, so the import indexes its providers itself
+        self.assertEqual([pk for pk, _ in search.search('wanj')], [wanjiku.pk])
+
+    def test_import_clients_ndjson(self):
+        path = self.write('clients.ndjson', '{"username": "amina", "password": "s3cret-pass"}\n\n{"username": "baraka"}\n')
+        call_command('import_users', path, role='client', workers=1, batch_size=1, stdout=StringIO())
+        self.assertTrue(User.objects.get(username='amina').check_password('s3cret-pass'))
+        self.assertFalse(User.objects.get(username='baraka').has_usable_password())
+        self.assertFalse(UserProfile.objects.get(user__username='baraka').is_provider)
+
+    def test_export(self):
+        provider = make_provider('fundi', -1.29, 36.82).user
+        customer = User.objects.create_user(username='customer', password='pass12345')
+        Booking.objects.create(client=customer, provider=provider, description='leak', total_amount=100)
+        Rating.objects.create(client=customer, provider=provider, stars=5)
+
+        out, err = StringIO(), StringIO()
+        call_command('export_data', 'bookings', stdout=out, stderr=err)
+        row = json.loads(out.getvalue())
+        self.assertEqual((row['client_username'], row['provider_username'], row['provider_cut']), ('customer', 'fundi', '90.00'))
+        self.assertIn('Exported 1 bookings', err.getvalue())
+
+        out = StringIO()
+        call_command('export_data', 'ratings', format='csv', stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'id,stars,comment,created_at,client_username,provider_username')
+        self.assertEqual(len(lines), 2)
+
+
+class ProviderSearchTests(TestCase):
+    def setUp(self):
+        provider_cache.invalidate()
+
+    def search(self, q, **params):
+        response = self.client.get('/api/search-providers/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [p['name'] for p in response.json()['providers']]
+
+    def test_prefix_matching_across_fields(self):
+        plumber = make_provider('wanjiku', -1.29, 36.82)
+        plumber.bio = 'Burst pipes and geysers in Westlands'
+        plumber.save()
+        make_provider('otieno', -1.29, 36.82, service='Electrician')
+        make_provider('hidden', -1.29, 36.82, verified=False)
+
+        self.assertEqual(self.search('plumb west'), ['wanjiku'])
+        self.assertEqual(self.search('WANJ'), ['wanjiku'])
+        self.assertEqual(self.search('elec'), ['otieno'])
+        self.assertEqual(self.search('hidd'), [])
+        self.assertEqual(self.search('"pipe*" OR'), [])
+
+        # Name changes live on the User row
+        user = plumber.user
+        user.first_name, user.last_name = 'Grace', 'Muthoni'
+        user.save()
+        self.assertEqual(self.search('muth'), ['Grace Muthoni'])
+
+        plumber.delete()
+        self.assertEqual(self.search('muth'), [])
+
+    def test_relevance_is_combined_with_distance(self):
+        make_provider('central', -1.29, 36.82)
+        make_provider('thika', -1.03, 37.07)
+        thika = (-1.03, 37.07)
+
+        self.assertEqual(self.search('plumber', lat=thika[0], lon=thika[1]), ['thika', 'central'])
+        self.assertEqual(self.search('plumber', lat=NAIROBI[0], lon=NAIROBI[1]), ['central', 'thika'])
+        self.assertEqual(self.search('plumber', lat=NAIROBI[0], lon=NAIROBI[1], radius=10), ['central'])
+
+        response = self.client.get('/api/search-providers/', {'q': 'plumber', 'lat': NAIROBI[0], 'lon': NAIROBI[1]})
+        first = response.json()['providers'][0]
+        self.assertLess(first['distance_km'], 1)
+
+    def test_invalid_requests(self):
+        for params in ({}, {'q': '!!'}, {'q': 'plumber', 'limit': 0}, {'q': 'plumber', 'radius': 5},
+                       {'q': 'plumber', 'lat': 'x', 'lon': '1'}, {'q': 'plumber', 'lat': 'nan', 'lon': '1'},
+                       {'q': 'plumber', 'lat': '1', 'lon': 'inf'}, {'q': 'plumber', 'lat': '95', 'lon': '1'},
+                       {'q': 'plumber', 'lat': '1'}, {'q': 'plumber', 'lat': '1', 'lon': '1', 'radius': 'nan'}):
+            self.assertEqual(self.client.get('/api/search-providers/', params).status_code, 400, params)
+
+    def test_rebuild_command(self):
+        profile = make_provider('fundi', -1.29, 36.82)
+        # update() skips the signals that keep the index in sync
+        UserProfile.objects.filter(pk=profile.pk).update(service_type='Carpenter')
+        self.assertEqual(self.search('carp'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('carp'), ['fundi'])
+
+
+class ServiceAvailabilityTests(TestCase):
+    def availability(self, **params):
+        response = self.client.get('/api/service-availability/', params)
+        self.assertEqual(response.status_code, 200)
+        return {row['service_type']: row['providers'] for row in response.json()['services']}
+
+    def test_counts_follow_profile_changes(self):
+        make_provider('a', -1.29, 36.82)
+        make_provider('b', -1.291, 36.821, service='plumber ')
+        electrician = make_provider('c', -1.29, 36.82, service='Electrician', verified=False)
+        make_provider('mombasa', -4.04, 39.67)
+        self.assertEqual(self.availability(lat=NAIROBI[0], lon=NAIROBI[1]), {'plumber': 2})
+        self.assertEqual(self.availability(), {'plumber': 3})
+
+        electrician.is_verified = True
+        electrician.save(update_fields=['is_verified'])
+        self.assertEqual(self.availability(lat=NAIROBI[0], lon=NAIROBI[1]), {'plumber': 2, 'electrician': 1})
+
+        # Moving away and changing trade, from a partially loaded instance
+        profile = UserProfile.objects.only('latitude', 'longitude').get(user__username='a')
+        profile.latitude, profile.longitude = -4.05, 39.66
+        profile.save(update_fields=['latitude', 'longitude'])
+        UserProfile.objects.get(user__username='b').user.delete()
+        self.assertEqual(self.availability(lat=NAIROBI[0], lon=NAIROBI[1]), {'electrician': 1})
+        self.assertEqual(self.availability(lat=-4.04, lon=39.67), {'plumber': 2})
+
+        out = StringIO()
+        call_command('rebuild_service_availability', stdout=out)
+        self.assertIn('in sync', out.getvalue())
+
+    def test_admin_verification_and_rebuild(self):
+        profile = make_provider('fundi', -1.29, 36.82, verified=False)
+        admin = User.objects.create_superuser(username='boss', password='pass12345')
+        self.client.force_login(admin)
+        self.client.post('/admin/servicehub_app/provider/', {
+            'action': 'make_verified', '_selected_action': [profile.pk],
+        })
+        self.assertEqual(self.availability(), {'plumber': 1})
+
+        # update() skips save(); the rebuild command repairs the counts
+        UserProfile.objects.filter(pk=profile.pk).update(service_type='Painter')
+        out = StringIO()
+        call_command('rebuild_service_availability', stdout=out)
+        self.assertIn('Repaired 2 count(s)', out.getvalue())
+        self.assertEqual(self.availability(), {'painter': 1})
+
+    def test_invalid_coordinates(self):
+        for params in ({'lat': 'x', 'lon': '1'}, {'lat': '1'}, {'lat': '1', 'lon': '1', 'radius': 500},
+                       {'lat': 'nan', 'lon': '1'}, {'lat': '1', 'lon': 'inf'}, {'lat': '-90.5', 'lon': '1'}):
+            self.assertEqual(self.client.get('/api/service-availability/', params).status_code, 400)
+
+
+class BookingStateMachineTests(TestCase):
+    def setUp(self):
+        self.provider = make_provider('fundi', -1.29, 36.82).user
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.booking = Booking.objects.create(client=self.customer, provider=self.provider, description='leak')
+
+    def post(self, user, url, data=None):
+        self.client.force_login(user)
+        return self.client.post(url, data or {}, content_type='application/json')
+
+    def test_lifecycle_is_logged(self):
+        pk = self.booking.pk
+        self.assertEqual(self.post(self.provider, f'/api/accept-quote/{pk}/').status_code, 404)
+        self.assertEqual(self.post(self.customer, f'/api/accept-quote/{pk}/').status_code, 409)
+        self.assertEqual(self.post(self.provider, f'/api/send-quote/{pk}/', {'price': '1000'}).status_code, 200)
+        self.assertEqual(self.post(self.customer, f'/api/accept-quote/{pk}/').status_code, 200)
+        response = self.post(self.provider, f'/api/send-quote/{pk}/', {'price': '1'})
+        self.assertEqual((response.status_code, response.json()['booking_status']), (409, 'Accepted'))
+        self.assertEqual(self.post(self.provider, f'/api/complete-job/{pk}/').status_code, 200)
+        start_batch(Booking.objects.filter(pk=pk))
+        process_batch(PayoutBatch.objects.get())
+
+        booking = Booking.objects.get(pk=pk)
+        self.assertEqual((booking.status, booking.total_amount), (Booking.Status.PAID, Decimal('1000.00')))
+        log = [(t.from_status, t.to_status, t.actor) for t in booking.transitions.order_by('pk')]
+        self.assertEqual(log, [
+            (Booking.Status.PENDING, Booking.Status.QUOTED, self.provider),
+            (Booking.Status.QUOTED, Booking.Status.ACCEPTED, self.customer),
+            (Booking.Status.ACCEPTED, Booking.Status.COMPLETED, self.provider),
+            (Booking.Status.COMPLETED, Booking.Status.PAID, None),
+        ])
+
+    def test_stale_instance_cannot_overwrite(self):
+        self.booking.transition('quote', total_amount=1000)
+        stale = Booking.objects.get(pk=self.booking.pk)
+        Booking.objects.get(pk=self.booking.pk).transition('accept')
+
+        # The provider's revised quote was based on the Quoted row
+        self.assertFalse(stale.transition('quote', total_amount=50))
+        self.assertEqual(stale.status, Booking.Status.ACCEPTED)
+        booking = Booking.objects.get(pk=self.booking.pk)
+        self.assertEqual((booking.status, booking.total_amount), (Booking.Status.ACCEPTED, Decimal('1000.00')))
+
+    def test_transition_writes_only_changed_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.booking.transition('quote', total_amount=1000)
+        update = next(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "servicehub_app_booking"'))
+        self.assertNotIn('"description"', update)
+        self.assertIn('WHERE ("servicehub_app_booking"."id" = ', update)
+        self.assertIn('"servicehub_app_booking"."status" = 1', update)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    # Threads use their own connections, so they only see committed data
+
+    def test_parallel_completions_count_once(self):
+        provider = make_provider('fundi', -1.29, 36.82).user
+        customer = User.objects.create_user(username='customer', password='pass12345')
+        booking = Booking.objects.create(client=customer, provider=provider, description='leak')
+        booking.transition('quote', total_amount=1000)
+        booking.transition('accept')
+
+        workers = 8
+        barrier = threading.Barrier(workers)
+
+        def complete(_):
+            try:
+                mine = Booking.objects.get(pk=booking.pk)
+                barrier.wait()
+                return mine.transition('complete', actor=provider)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(complete, range(workers)))
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(booking.transitions.filter(to_status=Booking.Status.COMPLETED).count(), 1)
+        self.assertEqual(ProviderLedger.objects.get(provider=provider).total_earned, Decimal('900.00'))
+
+
+class RateLimitTests(TestCase):
+    FEEDBACK = {'email': 'a@example.com', 'subject': 'Hi', 'message': 'Great service'}
+
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for name in ('first', 'second'):
+            user = User.objects.create_user(username=name, password='pass12345')
+            UserProfile.objects.create(user=user)
+            self.users.append(user)
+
+    def feedback(self, user):
+        self.client.force_login(user)
+        return self.client.post('/api/submit-feedback/', self.FEEDBACK, content_type='application/json')
+
+    @override_settings(RATE_LIMITS={'submit_feedback': {'user': '2/m', 'ip': '3/m'}})
+    def test_user_then_ip_limit(self):
+        self.assertEqual([self.feedback(self.users[0]).status_code for _ in range(3)], [200, 200, 429])
+        response = self.feedback(self.users[0])
+        self.assertEqual(response.status_code, 429)
+        # One token comes back every 30 seconds
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+
+        # The same address has one request left, whoever sends it
+        self.assertEqual([self.feedback(self.users[1]).status_code for _ in range(2)], [200, 429])
+
+    @override_settings(RATE_LIMITS={'submit_feedback': {'user': '1/m'}})
+    def test_limits_are_per_user(self):
+        self.assertEqual(self.feedback(self.users[0]).status_code, 200)
+        self.assertEqual(self.feedback(self.users[0]).status_code, 429)
+        self.assertEqual(self.feedback(self.users[1]).status_code, 200)
+
+    @override_settings(RATE_LIMITS={'create_booking': {'user': '1/h'}})
+    async def test_async_view(self):
+        profile = await sync_to_async(make_provider)('fundi', -1.29, 36.82)
+        client = AsyncClient()
+        await client.aforce_login(self.users[0])
+        statuses = []
+        for _ in range(2):
+            response = await client.post(f'/api/book/{profile.id}/', {'description': 'leak'},
+                                         content_type='application/json')
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 429])
+        self.assertEqual(await Booking.objects.acount(), 1)
+
+    def test_bucket_refills(self):
+        limits = [('key', (2, 60))]
+        stored, retry_after = take({}, limits, now=1000)
+        self.assertEqual(retry_after, 0)
+        stored, retry_after = take(stored, limits, now=1000)
+        self.assertEqual(retry_after, 0)
+        self.assertEqual(take(stored, limits, now=1000), ({}, 30))
+        # Half the period puts one token back
+        self.assertEqual(take(stored, limits, now=1030)[1], 0)
+        # A long wait refills the bucket, but never beyond its capacity
+        stored, _ = take(stored, limits, now=5000)
+        stored, _ = take(stored, limits, now=5000)
+        self.assertEqual(take(stored, limits, now=5000)[1], 30)
+
+
+class BenchmarkSuiteTests(TransactionTestCase):
+    # The benchmark sends requests from worker threads, which only see committed data
+
+    def test_seed_and_benchmark(self):
+        out = StringIO()
+        call_command('seed_data', providers=20, clients=30, bookings=200, ratings=20, stdout=out)
+        self.assertIn('Seeded 20 providers, 30 clients, 200 bookings and 20 ratings', out.getvalue())
+        call_command('reconcile_ledger', stdout=out)
+        self.assertIn('match their bookings', out.getvalue())
+
+        out = StringIO()
+        call_command('bench_api', requests=3, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['endpoints']), {
+            'nearby_providers', 'my_bookings', 'provider_dashboard', 'create_booking',
+            'send_quote', 'accept_quote', 'complete_job', 'submit_rating',
+        })
+        for name, result in report['endpoints'].items():
+            self.assertEqual((result['requests'], result['errors']), (3, 0), name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_nearby_benchmark(self):
+        out = StringIO()
+        call_command('bench_nearby', sizes=[100], requests=3, stdout=out)
+        rows = out.getvalue().splitlines()
+        self.assertEqual(rows[1].split()[0], '100')
+        self.assertEqual(rows[-1], 'Benchmark data rolled back.')
+        self.assertFalse(UserProfile.objects.exists())
+
+
+def flaky_task(fail_times=0):
+    # Job target for JobTests; fails the first fail_times attempts
+    job = Job.objects.get(status='running')
+    if job.attempts <= fail_times:
+        raise RuntimeError('boom')
+
+
+class JobTests(TestCase):
+    def test_runs_and_records_timing(self):
+        job = Job.enqueue(flaky_task)
+        self.assertEqual(job.task, 'servicehub_app.tests.flaky_task')
+        self.assertEqual([j.pk for j in run_pending()], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertIsNotNone(job.duration)
+
+    def test_retries_then_fails(self):
+        job = Job.enqueue(flaky_task, max_attempts=2, fail_times=5)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertIn('boom', job.error)
+        # Backed off, so nothing is due yet
+        self.assertIsNone(claim_next())
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_stale_jobs_are_requeued(self):
+        job = Job.enqueue(flaky_task)
+        self.assertEqual(claim_next().pk, job.pk)
+        self.assertIsNone(claim_next())
+        self.assertEqual(requeue_stale(timedelta(seconds=-1)), 1)
+        self.assertEqual(claim_next().pk, job.pk)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        provider_cache.invalidate()
+
+    def upload(self, size=(1200, 800)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, 'JPEG')
+        return SimpleUploadedFile('me.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def nearby(self):
+        return self.client.get('/api/nearby-providers/', {'lat': NAIROBI[0], 'lon': NAIROBI[1]}).json()['providers'][0]
+
+    def test_thumbnails_made_in_background(self):
+        profile = make_provider('fundi', -1.29, 36.82)
+        profile.profile_photo = self.upload()
+        profile.save()
+        job = Job.objects.get(task='servicehub_app.thumbnails.generate_thumbnails')
+        self.assertEqual(job.kwargs, {'profile_id': profile.pk, 'photo': profile.profile_photo.name})
+        # The upload stands in until the job has run
+        provider = self.nearby()
+        self.assertEqual((provider['photo'], provider['thumbnail']), (profile.profile_photo.url,) * 2)
+
+        run_pending()
+        profile.refresh_from_db()
+        with Image.open(profile.thumbnail_256.path) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (256, 171)))
+        with Image.open(profile.thumbnail_96.path) as thumb:
+            self.assertEqual(thumb.size, (96, 64))
+
+        provider = self.nearby()
+        self.assertEqual(provider['photo'], profile.thumbnail_256.url)
+        self.assertEqual(provider['thumbnail'], profile.thumbnail_96.url)
+
+        # A new photo clears the thumbnails until its own job has run
+        old_thumbnail = profile.thumbnail_256.path
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_photo = self.upload((300, 300))
+            profile.save()
+        self.assertFalse(profile.thumbnail_256)
+        self.assertFalse(os.path.exists(old_thumbnail))
+        self.assertEqual(Job.objects.filter(status='queued').count(), 1)
+
+        # The new thumbnails take the old names instead of piling up
+        run_pending()
+        profile.refresh_from_db()
+        self.assertEqual(profile.thumbnail_256.path, old_thumbnail)
+        self.assertEqual(len(os.listdir(os.path.dirname(old_thumbnail))), 2)
+        # So does running the job again for the same photo
+        generate_thumbnails(profile.pk, profile.profile_photo.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(old_thumbnail))), 2)
+
+
+class RecordingBackend(EventBackend):
+    """Stand-in event backend that just remembers what was published."""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, user_id, event):
+        self.published.append((user_id, event))
+
+
+class BookingEventTests(TestCase):
+    def setUp(self):
+        provider_cache.invalidate()
+        self.profile = make_provider('fundi', -1.29, 36.82)
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        self.booking = Booking.objects.create(client=self.customer, provider=self.profile.user, description='leak')
+
+    @override_settings(BOOKING_EVENTS_BACKEND='servicehub_app.tests.RecordingBackend')
+    def test_quote_published_after_commit(self):
+        self.client.force_login(self.profile.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'/api/send-quote/{self.booking.id}/', {'price': '1500'},
+                             content_type='application/json')
+            self.assertEqual(get_backend().published, [])
+
+        for callback in callbacks:
+            callback()
+        events = get_backend().published
+        self.assertEqual([user_id for user_id, _ in events], [self.customer.id, self.profile.user_id])
+        self.assertEqual(events[0][1]['type'], 'booking.quoted')
+        self.assertEqual(events[0][1]['status'], 'Quoted')
+        self.assertEqual(events[0][1]['total_amount'], '1500.00')
+
+    def test_stream_requires_asgi(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get('/api/booking-events/').status_code, 501)
+        # So the pages don't open it, and the browser doesn't keep retrying
+        self.assertNotContains(self.client.get('/my-history/'), 'EventSource(')
+        self.client.force_login(self.profile.user)
+        self.assertNotContains(self.client.get('/dashboard/'), 'EventSource(')
+
+    async def test_pages_open_stream_under_asgi(self):
+        client = AsyncClient()
+        for user, page in ((self.customer, '/my-history/'), (self.profile.user, '/dashboard/')):
+            await client.aforce_login(user)
+            self.assertContains(await client.get(page), "new EventSource('/api/booking-events/')")
+
+    async def test_stream_delivers_events(self):
+        client = AsyncClient()
+        await client.aforce_login(self.customer)
+        response = await client.get('/api/booking-events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        get_backend().publish(self.customer.id, {'type': 'booking.completed', 'booking_id': self.booking.id})
+        message = (await anext(stream)).decode()
+        self.assertTrue(message.startswith('event: booking\n'))
+        self.assertEqual(json.loads(message.split('data: ')[1])['booking_id'], self.booking.id)
+        # A client disconnect cancels the pending read, which drops the subscription
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertNotIn(self.customer.id, get_backend()._subscribers)
+
+
+@skipUnless(connection.vendor == 'sqlite' and 'init_command' in connection.settings_dict['OPTIONS'],
+            'SQLite tuning is disabled')
+class SQLiteTuningTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+class QueryPlanTests(TestCase):
+    """Fail when a hot view's SQL falls back to a full table scan or a sort."""
+
+    def setUp(self):
+        provider_cache.invalidate()
+        self.provider = make_provider('fundi', -1.29, 36.82).user
+        self.customer = User.objects.create_user(username='customer', password='pass12345')
+        UserProfile.objects.create(user=self.customer)
+        for status in (Booking.Status.PENDING, Booking.Status.COMPLETED):
+            Booking.objects.create(client=self.customer, provider=self.provider, description='x',
+                                   total_amount=100, status=status)
+
+    def assert_plans_use_indexes(self, url, user=None, allow_sort=False, **params):
+        if user:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+                    sort = 'TEMP B-TREE' in detail and not allow_sort
+                    self.assertFalse(full_scan or sort, f'{detail}\n  in: {sql}')
+
+    def test_my_bookings(self):
+        self.assert_plans_use_indexes('/api/my-bookings/', self.customer)
+
+    def test_provider_dashboard(self):
+        self.assert_plans_use_indexes('/dashboard/', self.provider)
+
+    def test_nearby_cache_rebuild(self):
+        self.assert_plans_use_indexes('/api/nearby-providers/', lat=NAIROBI[0], lon=NAIROBI[1])
+
+    def test_service_availability(self):
+        # Grouping by service type sorts the handful of matching rows
+        self.assert_plans_use_indexes('/api/service-availability/', allow_sort=True, lat=NAIROBI[0], lon=NAIROBI[1])
+
+    def test_provider_search(self):
+        # Ranking has to sort the matches, but only the matches
+        self.assert_plans_use_indexes('/api/search-providers/', allow_sort=True, q='plumb',
+                                      lat=NAIROBI[0], lon=NAIROBI[1])
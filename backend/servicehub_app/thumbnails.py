@@ -0,0 +1,49 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+
+# Longest side in pixels of each thumbnail field; listings use thumbnail_96,
+# the provider cards on the home page thumbnail_256
+THUMBNAIL_SIZES = {'thumbnail_96': 96, 'thumbnail_256': 256}
+WEBP_QUALITY = 80
+
+
+def make_thumbnail(image, size):
+    """Return a WebP ContentFile of ``image`` scaled to fit within size x size."""
+    thumb = image.copy()
+    thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if thumb.mode not in ('RGB', 'RGBA'):
+        thumb = thumb.convert('RGBA' if 'transparency' in thumb.info or thumb.mode in ('LA', 'PA') else 'RGB')
+    buffer = BytesIO()
+    thumb.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_thumbnails(profile_id, photo):
+    """Background job: build a profile's thumbnails from its current photo.
+
+    ``photo`` is the photo name when the job was queued; if the provider has
+    uploaded another photo since, the job queued for that one does the work.
+    """
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.profile_photo.name != photo:
+        return
+
+    with profile.profile_photo.open('rb') as f:
+        # Honour camera orientation, which the thumbnails would otherwise lose with the EXIF data
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+
+    for field, size in THUMBNAIL_SIZES.items():
+        thumbnail, name = getattr(profile, field), f'{profile.pk}_{size}.webp'
+        # Replace the previous file rather than piling up suffixed copies
+        if thumbnail:
+            thumbnail.delete(save=False)
+        path = thumbnail.field.generate_filename(profile, name)
+        if thumbnail.storage.exists(path):
+            thumbnail.storage.delete(path)
+        thumbnail.save(name, make_thumbnail(image, size), save=False)
+    profile.save(update_fields=list(THUMBNAIL_SIZES))
@@ -6,8 +6,13 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('register/', views.register_view, name='register'),
     path('api/nearby-providers/', views.find_nearby_providers, name='nearby_providers'),
+    path('api/search-providers/', views.search_providers, name='search_providers'),
+    path('api/service-availability/', views.service_availability, name='service_availability'),
+    path('api/provider-cache-stats/', views.provider_cache_stats, name='provider_cache_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('api/book/<int:provider_id>/', views.create_booking, name='create_booking'),
     path('api/my-bookings/', views.get_my_bookings, name='my_bookings'),
+    path('api/booking-events/', views.booking_events, name='booking_events'),
     path('dashboard/', views.provider_dashboard, name='provider_dashboard'),
     path('apply/', views.apply_provider, name='apply_provider'), # New custom form path
     path('register/', views.register_view, name='register'),
@@ -20,6 +25,7 @@ urlpatterns = [
     path('api/complete-job/<int:booking_id>/', views.complete_job, name='complete_job'),
     path('api/submit-rating/', views.submit_rating, name='submit_rating'),
     path('api/send-quote/<int:booking_id>/', views.send_quote, name='send_quote'),
+    path('api/accept-quote/<int:booking_id>/', views.accept_quote, name='accept_quote'),
     path('api/submit-feedback/', views.submit_feedback, name='submit_feedback'),
     path('contact/', views.contact_page, name='contact'),
 
@@ -1,63 +1,213 @@
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.db.models import Sum
-from math import radians, cos, sin, asin, sqrt
-from django.shortcuts import get_object_or_404, redirect
-from .models import Booking, UserProfile, Rating, Feedback
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Sum, Q, F, Count, Max
+from django.db.models.functions import TruncDate
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.paginator import Paginator
+from django.shortcuts import get_object_or_404, aget_object_or_404, redirect
+from .models import Booking, UserProfile, Rating, Feedback, ProviderLedger, ServiceAvailability
+from .geo import bounding_box, tiles_in_box, valid_coordinates
+from .instrumentation import metrics
+from .provider_cache import provider_cache
+from . import search
+from .caching import aget_or_build, cache_key
+from .conditional import make_etag, not_modified, set_validators
+from .events import get_backend, notify_booking, publish_booking_event
+from .ratelimit import rate_limit
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
+import asyncio
 import json
+from asgiref.sync import sync_to_async
+from datetime import datetime
+from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.vary import vary_on_cookie
 from django.views.decorators.csrf import csrf_protect
 
 
-# Haversine formula to calculate distance in km
-def calculate_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Earth radius
-    return c * r
+# Defaults and limits for the nearby providers API
+NEARBY_RADIUS_KM = 3.0
+MAX_NEARBY_RADIUS_KM = 25.0
+NEARBY_PAGE_SIZE = 20
+MAX_NEARBY_PAGE_SIZE = 100
+# Search coordinates are rounded to ~110m so clients in the same square share
+# ETags and cached responses, which browsers and proxies may reuse for a while
+NEARBY_COORD_DECIMALS = 3
+NEARBY_MAX_AGE = 30
+
+# Provider text search. With coordinates, the best SEARCH_CANDIDATES text
+# matches are re-ranked by relevance / (1 + distance / SEARCH_DISTANCE_KM),
+# so a provider that far away needs twice the relevance of one next door
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+SEARCH_CANDIDATES = 200
+SEARCH_DISTANCE_KM = 5.0
+
+# Rows per page for the provider dashboard job lists and booking history API
+DASHBOARD_PAGE_SIZE = 25
+BOOKINGS_PAGE_SIZE = 50
+MAX_BOOKINGS_PAGE_SIZE = 200
+
+# Static pages are cached per Cookie header, as they show the logged-in user.
+# vary_on_cookie has to run inside cache_page: SessionMiddleware only adds
+# its Vary header after the decorator has cached the response. A cached CSRF
+# token stays valid because the csrftoken cookie is part of the key. API
+# responses are cached under keys that include their ETag.
+PAGE_CACHE_SECONDS = 60 * 5
+API_CACHE_SECONDS = 60 * 5
+
+# Idle booking event streams send a comment this often so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = 15
 
 
 # 1. View to render the HTML home page
+@cache_page(PAGE_CACHE_SECONDS)
+@vary_on_cookie
 def home(request):
     return render(request, 'servicehub_app/index.html')
 
 
 # 2. API View to return nearby providers as JSON
-def find_nearby_providers(request):
+async def find_nearby_providers(request):
     client_lat = request.GET.get('lat')
     client_lon = request.GET.get('lon')
 
     if not client_lat or not client_lon:
         return JsonResponse({'error': 'Coordinates required'}, status=400)
 
-    providers = UserProfile.objects.filter(is_provider=True, is_verified=True)
-    nearby_list = []
-
-    for p in providers:
-        if p.latitude and p.longitude:
-            dist = calculate_distance(client_lat, client_lon, p.latitude, p.longitude)
-            if dist <= 3.0:
-                nearby_list.append({
-                    'id': p.id,
-                    'name': p.user.get_full_name() or p.user.username,
-                    'service': p.service_type,
-                    'phone': p.phone_number,
-                    'photo': p.profile_photo.url if p.profile_photo else None,
-                    'distance_km': round(dist, 2),
-                    'rating': p.get_rating(),
-                    'review_count': p.get_review_count()
-                })
-    return JsonResponse({'providers': nearby_list})
+    try:
+        client_lat = round(float(client_lat), NEARBY_COORD_DECIMALS)
+        client_lon = round(float(client_lon), NEARBY_COORD_DECIMALS)
+        radius = float(request.GET.get('radius', NEARBY_RADIUS_KM))
+        limit = int(request.GET.get('limit', NEARBY_PAGE_SIZE))
+        # The cursor is the "distance:id" of the last provider already shown
+        cursor = request.GET.get('cursor')
+        after = None
+        if cursor:
+            after_dist, after_id = cursor.split(':')
+            after = (float(after_dist), int(after_id))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid search parameters'}, status=400)
+
+    if not valid_coordinates(client_lat, client_lon):
+        return JsonResponse({'error': 'Invalid search parameters'}, status=400)
+    if not 0 < radius <= MAX_NEARBY_RADIUS_KM or not 0 < limit <= MAX_NEARBY_PAGE_SIZE:
+        return JsonResponse({'error': 'Radius or limit out of range'}, status=400)
+
+    # Verified providers are cached in-process (see provider_cache); the
+    # snapshot narrows to nearby grid cells before the vectorised distance
+    # pass, and only the closest limit + 1 are sorted
+    snapshot = await sync_to_async(provider_cache.get)()
+    service = request.GET.get('service')
+
+    # The answer depends only on the snapshot and the search, so a client
+    # holding the same ETag needn't be sent it again
+    etag = make_etag(snapshot.digest, client_lat, client_lon, radius, limit, after, service)
+    cache_headers = {'public': True, 'max_age': NEARBY_MAX_AGE}
+    response = not_modified(request, etag, **cache_headers)
+    if response is not None:
+        return response
+
+    async def build():
+        matches = snapshot.search(client_lat, client_lon, radius, k=limit + 1, service=service, after=after)
+        next_cursor = None
+        if len(matches) > limit:
+            matches = matches[:limit]
+            last_row, last_dist = matches[-1]
+            next_cursor = f"{last_dist!r}:{last_row['id']}"
+
+        nearby_list = [dict(row, distance_km=round(dist, 2)) for row, dist in matches]
+        return {'providers': nearby_list, 'next_cursor': next_cursor}
+
+    # Rounded coordinates mean nearby clients share one cached answer
+    data = await aget_or_build(cache_key('nearby', etag), build, API_CACHE_SECONDS)
+    response = JsonResponse(data)
+    return set_validators(response, etag, **cache_headers)
+
+
+async def search_providers(request):
+    query = request.GET.get('q', '').strip()
+    if not search.search_words(query):
+        return JsonResponse({'error': 'Search text required'}, status=400)
+
+    try:
+        limit = int(request.GET.get('limit', SEARCH_PAGE_SIZE))
+        lat, lon = request.GET.get('lat'), request.GET.get('lon')
+        near = (float(lat), float(lon)) if lat or lon else None
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid search parameters'}, status=400)
+    if near is not None and not valid_coordinates(*near):
+        return JsonResponse({'error': 'Invalid search parameters'}, status=400)
+    if not 0 < limit <= MAX_SEARCH_PAGE_SIZE or (radius is not None and (near is None or not 0 < radius)):
+        return JsonResponse({'error': 'Limit or radius out of range'}, status=400)
+
+    matches = await sync_to_async(search.search)(query, SEARCH_CANDIDATES if near else limit)
+    # Display rows come from the cached snapshot, which only holds providers
+    # with a location, like nearby search
+    snapshot = await sync_to_async(provider_cache.get)()
+    if near:
+        distances = snapshot.distances(*near, [profile_id for profile_id, _ in matches])
+        ranked = sorted((
+            (relevance / (1 + distances[profile_id] / SEARCH_DISTANCE_KM), profile_id)
+            for profile_id, relevance in matches
+            if profile_id in distances and (radius is None or distances[profile_id] <= radius)
+        ), key=lambda item: (-item[0], item[1]))
+        results = [dict(snapshot.rows_by_id[profile_id], distance_km=round(distances[profile_id], 2),
+                        score=round(score, 4)) for score, profile_id in ranked[:limit]]
+    else:
+        results = [dict(snapshot.rows_by_id[profile_id], score=round(relevance, 4))
+                   for profile_id, relevance in matches if profile_id in snapshot.rows_by_id]
+    return JsonResponse({'providers': results})
+
+
+@cache_control(public=True, max_age=NEARBY_MAX_AGE)
+def service_availability(request):
+    # Verified providers per service type, from the precomputed tile counts.
+    # Near a point, every tile overlapping the search box counts, so the
+    # totals may include providers up to a tile (~1km) beyond the radius.
+    counts = ServiceAvailability.objects.filter(provider_count__gt=0)
+    lat, lon = request.GET.get('lat'), request.GET.get('lon')
+    if lat or lon:
+        try:
+            lat, lon = float(lat), float(lon)
+            radius = float(request.GET.get('radius', NEARBY_RADIUS_KM))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+        if not valid_coordinates(lat, lon):
+            return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+        if not 0 < radius <= MAX_NEARBY_RADIUS_KM:
+            return JsonResponse({'error': 'Radius out of range'}, status=400)
+        rows, cols = tiles_in_box(*bounding_box(lat, lon, radius))
+        counts = counts.filter(tile_row__range=rows, tile_col__range=cols)
+
+    services = counts.values('service_type').annotate(providers=Sum('provider_count')).order_by('-providers', 'service_type')
+    return JsonResponse({'services': list(services)})
+
+
+@staff_member_required
+def provider_cache_stats(request):
+    # Counters are per worker process; hit this a few times to sample workers
+    return JsonResponse(provider_cache.stats())
+
+
+def metrics_view(request):
+    # Prometheus text format; each worker process reports its own requests
+    token = settings.METRICS_TOKEN
+    if not (request.user.is_staff or (token and request.headers.get('Authorization') == f'Bearer {token}')):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
 
 
 # 3. View to render the Registration page
+@cache_page(PAGE_CACHE_SECONDS)
+@vary_on_cookie
 def register_view(request):
     return render(request, 'servicehub_app/register.html')
 
@@ -80,31 +230,146 @@ def book_service(request, provider_id):
 
 @csrf_protect
 @login_required
-def create_booking(request, provider_id):
+@rate_limit('create_booking')
+async def create_booking(request, provider_id):
     if request.method == 'POST':
         data = json.loads(request.body)
-        provider_profile = get_object_or_404(UserProfile, id=provider_id, is_provider=True)
+        provider_profile = await aget_object_or_404(UserProfile, id=provider_id, is_provider=True)
 
-        Booking.objects.create(
-            client=request.user,
-            provider=provider_profile.user,
+        booking = await Booking.objects.acreate(
+            client=await request.auser(),
+            provider_id=provider_profile.user_id,
             description=data.get('description'),
-            status='Pending'  # No price yet!
+            status=Booking.Status.PENDING  # No price yet!
         )
+        # acreate() has already committed in autocommit mode
+        notify_booking(booking, 'booking.created')
         return JsonResponse({'status': 'success'})
+    return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
     
 @login_required
-def get_my_bookings(request):
-    # Fetch bookings where the current user is the client
-    bookings = Booking.objects.filter(client=request.user).order_by('-created_at')
-    data = [{
-        'provider': b.provider.username,
-        'total_amount': b.total_amount,
-        'status': b.status,
-        'date': b.created_at.strftime("%Y-%m-%d")
-    } for b in bookings]
-    return JsonResponse(data, safe=False)
+async def get_my_bookings(request):
+    user = await request.auser()
+    # Fetch bookings where the current user is the client, newest first.
+    # Only the columns the UI needs are selected, with the provider's name
+    # and the booking date resolved in SQL.
+    bookings = Booking.objects.filter(client=user).order_by('-created_at', '-id').values(
+        'id', 'total_amount', 'status', 'created_at',
+        provider_name=F('provider__username'),
+        date=TruncDate('created_at'),
+    )
+
+    # NDJSON export streams every booking without building the list in memory.
+    # Django buffers iterators of the wrong kind for the server, so hand ASGI
+    # an async iterator and WSGI a sync one.
+    if request.GET.get('format') == 'ndjson':
+        if isinstance(request, ASGIRequest):
+            rows = (
+                json.dumps(booking_row(b), cls=DjangoJSONEncoder) + '\n'
+                async for b in bookings.aiterator(chunk_size=500)
+            )
+        else:
+            rows = (
+                json.dumps(booking_row(b), cls=DjangoJSONEncoder) + '\n'
+                for b in bookings.iterator(chunk_size=500)
+            )
+        response = StreamingHttpResponse(rows, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="my-bookings.ndjson"'
+        return response
+
+    try:
+        limit = int(request.GET.get('limit', BOOKINGS_PAGE_SIZE))
+        # The cursor is the "created_at|id" of the last booking already shown
+        cursor = request.GET.get('cursor')
+        if cursor:
+            created_at, booking_id = cursor.split('|')
+            created_at, booking_id = datetime.fromisoformat(created_at), int(booking_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+    if not 0 < limit <= MAX_BOOKINGS_PAGE_SIZE:
+        return JsonResponse({'error': 'Limit out of range'}, status=400)
+
+    # The newest updated_at and the row count change whenever a booking is
+    # added, changed or removed, and both come straight from an index
+    version = await Booking.objects.filter(client=user).aaggregate(
+        last_change=Max('updated_at'), count=Count('id'),
+    )
+    etag = make_etag(user.pk, version['last_change'], version['count'], request.GET.get('cursor'), limit)
+    # ETag only: deleting a booking changes the count but not the newest
+    # updated_at, so Last-Modified alone would answer a stale 304
+    cache_headers = {'private': True, 'no_cache': True}
+    response = not_modified(request, etag, **cache_headers)
+    if response is not None:
+        return response
+
+    async def build():
+        page_bookings = bookings
+        if cursor:
+            page_bookings = bookings.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=booking_id))
+
+        page = [b async for b in page_bookings[:limit + 1]]
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = f"{page[-1]['created_at'].isoformat()}|{page[-1]['id']}"
+
+        data = {'bookings': [booking_row(b) for b in page], 'next_cursor': next_cursor}
+        if not cursor:
+            # Totals for the history page header, so it needn't load every page
+            data['summary'] = await Booking.objects.filter(client=user).aaggregate(
+                total_spent=Sum('total_amount'), total_to_providers=Sum('provider_cut'),
+            )
+            data['summary']['count'] = version['count']
+        return data
+
+    # The ETag covers the version marker, so a cached page is never stale
+    data = await aget_or_build(cache_key('my-bookings', etag), build, API_CACHE_SECONDS)
+    return set_validators(JsonResponse(data), etag, **cache_headers)
+
+
+def booking_events_available(request):
+    # Each open event stream holds a connection, which only an ASGI server
+    # can afford; under WSGI the pages skip live updates
+    return isinstance(request, ASGIRequest)
+
+
+@login_required
+async def booking_events(request):
+    # Server-Sent Events stream of the user's booking changes
+    if not booking_events_available(request):
+        return JsonResponse({'error': 'Booking events require the ASGI server'}, status=501)
+    user = await request.auser()
+
+    async def stream():
+        subscription = get_backend().subscribe(user.pk)
+        try:
+            # Ask browsers to wait a few seconds before reconnecting
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: booking\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def booking_row(b):
+    return {
+        'id': b['id'],
+        'provider': b['provider_name'],
+        'total_amount': b['total_amount'],
+        'status': Booking.Status(b['status']).label,
+        'date': b['date'],
+    }
 
 
 @login_required
@@ -112,24 +377,26 @@ def provider_dashboard(request):
     profile = get_object_or_404(UserProfile, user=request.user)
 
     # All jobs for this provider
-    all_jobs = Booking.objects.filter(provider=request.user).order_by('-created_at')
+    all_jobs = Booking.objects.filter(provider=request.user).select_related('client').order_by('-created_at')
 
-    # Filtered lists for the UI
-    active_jobs = all_jobs.filter(is_paid_to_provider=False)
-    payout_history = all_jobs.filter(is_paid_to_provider=True)
+    # Filtered lists for the UI, one page at a time
+    active_jobs = Paginator(all_jobs.filter(is_paid_to_provider=False), DASHBOARD_PAGE_SIZE)
+    payout_history = Paginator(all_jobs.filter(is_paid_to_provider=True), DASHBOARD_PAGE_SIZE)
 
-    # Financial Summaries
-    total_earned = all_jobs.filter(status='completed').aggregate(Sum('provider_cut'))['provider_cut__sum'] or 0
-    already_paid = payout_history.aggregate(Sum('provider_cut'))['provider_cut__sum'] or 0
-    pending_payout = total_earned - already_paid
+    # Financial Summaries, read from the running ledger (see reconcile_ledger)
+    ledger = ProviderLedger.objects.filter(provider=request.user).first() or ProviderLedger()
+    total_earned = ledger.total_earned
+    already_paid = ledger.total_paid
+    pending_payout = ledger.pending_payout
 
     context = {
-        'active_jobs': active_jobs,
-        'payout_history': payout_history,
+        'active_jobs': active_jobs.get_page(request.GET.get('active_page')),
+        'payout_history': payout_history.get_page(request.GET.get('payout_page')),
         'total_earned': total_earned,
         'pending_payout': pending_payout,
         'already_paid': already_paid,
-        'profile': profile
+        'profile': profile,
+        'booking_events': booking_events_available(request),
     }
     return render(request, 'servicehub_app/provider_dashboard.html', context)
 
@@ -184,7 +451,8 @@ def register_client(request):
 
 @login_required
 def client_history_view(request):
-    return render(request, 'servicehub_app/client_history.html')
+    return render(request, 'servicehub_app/client_history.html',
+                  {'booking_events': booking_events_available(request)})
 
 
 @login_required
@@ -193,21 +461,45 @@ def complete_job(request, booking_id):
         # Ensure the job belongs to the logged-in provider
         booking = get_object_or_404(Booking, id=booking_id, provider=request.user)
 
-        if booking.status != 'completed':
-            booking.status = 'completed'
-            booking.save()
+        if booking.transition('complete', actor=request.user):
+            publish_booking_event(booking, 'booking.completed')
             return JsonResponse({'status': 'success', 'message': 'Job marked as completed!'})
+        return transition_refused(booking, 'completed')
 
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
 
 @login_required
+def accept_quote(request, booking_id):
+    if request.method == 'POST':
+        # Only the client who made the booking can accept its quote
+        booking = get_object_or_404(Booking, id=booking_id, client=request.user)
+
+        if booking.transition('accept', actor=request.user):
+            publish_booking_event(booking, 'booking.accepted')
+            return JsonResponse({'status': 'success', 'message': 'Quote accepted!'})
+        return transition_refused(booking, 'accepted')
+
+    return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+
+
+def transition_refused(booking, verb):
+    # The booking is not, or no longer, in a state the action applies to
+    return JsonResponse({
+        'status': 'error',
+        'message': f"This booking is {booking.get_status_display()} and can't be {verb}.",
+        'booking_status': booking.get_status_display(),
+    }, status=409)
+
+
+@login_required
+@rate_limit('submit_rating')
 def submit_rating(request):
     if request.method == 'POST':
         data = json.loads(request.body)
         provider_user = get_object_or_404(User, username=data['provider_username'])
 
-        # Create or update the rating
+        # Create or update the rating; Rating.save() adjusts the provider's aggregates
         Rating.objects.update_or_create(
             client=request.user,
             provider=provider_user,
@@ -219,6 +511,7 @@ def submit_rating(request):
 
 
 @login_required
+@rate_limit('send_quote')
 def send_quote(request, booking_id):
     if request.method == 'POST':
         # Ensure the person quoting is the assigned provider
@@ -228,9 +521,10 @@ def send_quote(request, booking_id):
         quote_price = data.get('price')
 
         if quote_price:
-            booking.total_amount = quote_price
-            booking.status = 'Quoted'  # Move status from Pending to Quoted
-            booking.save()  # This triggers your 90/10 logic in models.py
+            # Pending (or already Quoted) to Quoted; the 90/10 split is worked out in models.py
+            if not booking.transition('quote', actor=request.user, total_amount=quote_price):
+                return transition_refused(booking, 'quoted')
+            publish_booking_event(booking, 'booking.quoted')
 
             return JsonResponse({'status': 'success', 'message': 'Quote sent!'})
 
@@ -238,6 +532,7 @@ def send_quote(request, booking_id):
 
 
 @login_required
+@rate_limit('submit_feedback')
 def submit_feedback(request):
     if request.method == 'POST':
         data = json.loads(request.body)
@@ -254,5 +549,7 @@ def submit_feedback(request):
         return JsonResponse({'status': 'success', 'message': 'Thank you! Your feedback has been received.'})
 
 
+@cache_page(PAGE_CACHE_SECONDS)
+@vary_on_cookie
 def contact_page(request):
     return render(request, 'servicehub_app/contact.html')